@@ -4,15 +4,75 @@ Expõe endpoints para manipulação de arquivos Excel através de HTTP.
 """
 import os
 import logging
-from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Depends
+import shutil
+import tempfile
+
+import anyio
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
 
-from services.excel_processor import process_excel
+from services.consolidation import DEFAULT_MAX_WORKERS, consolidate_excel
+from services.excel_processor import (
+    MATCH_MODES,
+    MAX_COMPRESSION_LEVEL,
+    MIN_COMPRESSION_LEVEL,
+    build_match_report,
+    process_excel_with_report,
+)
+from services.memory_guard import (
+    MB,
+    MemoryBudgetTimeout,
+    MemoryGuard,
+    MemoryLimitExceeded,
+    WORKER_PROCESS_MEMORY_BYTES,
+    estimate_workbook_memory,
+)
+from services.result_store import DEFAULT_TTL_SECONDS, ResultStore, parse_range_header
 
 # Configuração de segurança
 API_KEY = os.getenv('API_KEY')
 
+# Configuração de memória (controle de admissão por tamanho estimado da planilha)
+MEMORY_BUDGET_MB = int(os.getenv('MEMORY_BUDGET_MB', '400'))
+MAX_REQUEST_MEMORY_MB = int(os.getenv('MAX_REQUEST_MEMORY_MB', str(MEMORY_BUDGET_MB)))
+MEMORY_QUEUE_TIMEOUT = float(os.getenv('MEMORY_QUEUE_TIMEOUT', '30'))
+
+memory_guard = MemoryGuard(
+    budget_bytes=MEMORY_BUDGET_MB * MB,
+    max_request_bytes=MAX_REQUEST_MEMORY_MB * MB,
+    queue_timeout=MEMORY_QUEUE_TIMEOUT,
+)
+
+# Configuração da saída
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ZIP_COMPRESSION_LEVEL = int(os.environ['ZIP_COMPRESSION_LEVEL']) if os.getenv('ZIP_COMPRESSION_LEVEL') else None
+if ZIP_COMPRESSION_LEVEL is not None and not (MIN_COMPRESSION_LEVEL <= ZIP_COMPRESSION_LEVEL <= MAX_COMPRESSION_LEVEL):
+    # Erro de configuração do servidor: falha na inicialização, não em cada requisição (400)
+    raise RuntimeError(
+        f"ZIP_COMPRESSION_LEVEL inválido: {ZIP_COMPRESSION_LEVEL} "
+        f"(use {MIN_COMPRESSION_LEVEL} a {MAX_COMPRESSION_LEVEL})"
+    )
+OUTPUT_CHUNK_SIZE = int(os.getenv('OUTPUT_CHUNK_SIZE', str(64 * 1024)))
+if OUTPUT_CHUNK_SIZE <= 0:
+    # Com 0 o corpo sairia vazio apesar do Content-Length completo
+    raise RuntimeError(f"OUTPUT_CHUNK_SIZE inválido: {OUTPUT_CHUNK_SIZE} (use um valor maior que 0)")
+
+# Comparação do ESTABELECIMENTO com os filtros: "exact" (padrão) ou "normalized"
+MATCH_MODE = os.getenv('MATCH_MODE', 'exact')
+if MATCH_MODE not in MATCH_MODES:
+    raise RuntimeError(f"MATCH_MODE inválido: {MATCH_MODE} (use {', '.join(MATCH_MODES)})")
+MATCH_MODE_PATTERN = f"^({'|'.join(MATCH_MODES)})$"
+
+CONSOLIDATION_MAX_WORKERS = int(os.getenv('CONSOLIDATION_MAX_WORKERS', str(DEFAULT_MAX_WORKERS)))
+CONSOLIDATED_FILENAME = "consolidado.xlsx"
+
+result_store = ResultStore(
+    directory=os.getenv('RESULTS_DIR'),
+    ttl_seconds=int(os.getenv('RESULTS_TTL_SECONDS', str(DEFAULT_TTL_SECONDS))),
+)
+
 # Configuração de logging
 logging.basicConfig(
     level=logging.INFO,
@@ -41,9 +101,69 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "Content-Disposition", "Content-Range", "Accept-Ranges", "X-Result-Id",
+        "X-Match-Mode", "X-Match-Recovered", "X-Match-Near-Misses",
+    ],
 )
 
 
+# =====================
+# Respostas
+# =====================
+class RangeFileResponse(Response):
+    """
+    Envia um arquivo do disco em blocos de tamanho fixo, com suporte a HEAD e Range.
+    Usa a extensão ASGI `http.response.zerocopysend` (sendfile) quando o servidor oferece.
+    """
+
+    def __init__(self, path: str, size: int, filename: str, byte_range: tuple = None, headers: dict = None):
+        self.path = path
+        self.start, self.end = byte_range if byte_range else (0, size - 1)
+        super().__init__(
+            status_code=206 if byte_range else 200,
+            media_type=XLSX_MEDIA_TYPE,
+            headers=headers,
+        )
+        self.headers["content-length"] = str(max(self.end - self.start + 1, 0))
+        self.headers["accept-ranges"] = "bytes"
+        self.headers["content-disposition"] = f'attachment; filename="{filename}"'
+        if byte_range:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        length = self.end - self.start + 1
+        if scope["method"].upper() == "HEAD" or length <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": length,
+                    "more_body": False,
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = length
+            while remaining > 0:
+                chunk = await file.read(min(OUTPUT_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # Arquivo encolheu durante o envio (ex.: expirou): encerra o corpo
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
 # =====================
 # Dependências de Segurança
 # =====================
@@ -90,6 +210,9 @@ async def root():
         "endpoints": {
             "health": "GET /health",
             "process": "POST /process",
+            "consolidate": "POST /consolidate",
+            "match_report": "POST /match-report",
+            "results": "GET|HEAD /results/{result_id}",
             "docs": "GET /docs"
         }
     }
@@ -109,6 +232,9 @@ async def health_check():
 @app.post("/process")
 async def process_file(
     file: UploadFile = File(...),
+    compression_level: int = Query(None, ge=MIN_COMPRESSION_LEVEL, le=MAX_COMPRESSION_LEVEL),
+    match_mode: str = Query(None, pattern=MATCH_MODE_PATTERN),
+    near_misses: bool = Query(False),
     api_key: str = Depends(verify_api_key)
 ):
     """
@@ -116,14 +242,23 @@ async def process_file(
     
     Args:
         file: Arquivo Excel (.xlsx) para processamento
+        compression_level: Nível de compressão do .xlsx gerado (0-9, padrão: ZIP_COMPRESSION_LEVEL)
+        match_mode: Comparação do ESTABELECIMENTO ("exact" ou "normalized", padrão: MATCH_MODE)
+        near_misses: Também procura valores descartados parecidos com os filtros
+            (mais lento em colunas com muitos valores distintos; ver POST /match-report)
         api_key: API Key validada (via dependency injection)
         
     Returns:
-        StreamingResponse com o arquivo processado para download
+        RangeFileResponse com o arquivo processado para download. O resultado
+        fica disponível em /results/{X-Result-Id} para downloads retomáveis.
+        Os headers X-Match-* resumem o relatório de comparação do ESTABELECIMENTO
+        (X-Match-Near-Misses só com near_misses=true).
         
     Raises:
         HTTPException 401: Se a API Key não for fornecida ou for inválida
         HTTPException 400: Se o formato do arquivo não for .xlsx
+        HTTPException 413: Se a memória estimada exceder o limite por requisição
+        HTTPException 503: Se não houver memória livre após o tempo máximo na fila
         HTTPException 500: Se ocorrer erro durante o processamento
     """
     # Validação de tipo de arquivo
@@ -141,19 +276,66 @@ async def process_file(
         file_bytes = await file.read()
         logger.info(f"Arquivo lido com sucesso: {len(file_bytes)} bytes")
         
-        # Processamento
-        output = process_excel(file_bytes)
+        # Estimativa de memória antes de abrir a planilha
+        estimate = estimate_workbook_memory(file_bytes)
+        logger.info(
+            f"Memória estimada para {file.filename}: {estimate.estimated_bytes // MB} MB "
+            f"({estimate.cells} células, {estimate.xml_bytes // MB} MB de XML)"
+        )
+        
+        if compression_level is None:
+            compression_level = ZIP_COMPRESSION_LEVEL
+        match_mode = match_mode or MATCH_MODE
+        
+        # Processamento (fora do event loop, dentro do orçamento de memória)
+        async with memory_guard.reserve(estimate.estimated_bytes):
+            output, match_report = await run_in_threadpool(
+                process_excel_with_report, file_bytes, compression_level, match_mode, near_misses
+            )
         logger.info(f"Processamento concluído com sucesso para: {file.filename}")
         
-        # Preparação da resposta
+        recovered_rows = sum(item["rows"] for item in match_report.recovered)
+        if recovered_rows:
+            logger.info(f"{recovered_rows} linhas aceitas pela normalização em {file.filename}")
+        if match_report.near_misses:
+            logger.warning(
+                f"Valores de ESTABELECIMENTO parecidos com os filtros foram descartados em "
+                f"{file.filename}: {[item['value'] for item in match_report.near_misses]}"
+            )
+        
+        # Preparação da resposta: grava em disco e libera o buffer antes do envio
         output_filename = f"processado_{file.filename}"
+        stored = await run_in_threadpool(result_store.save, output, output_filename)
+        output.close()
+        
+        headers = {
+            "X-Result-Id": stored.result_id,
+            "X-Match-Mode": match_report.mode,
+            "X-Match-Recovered": str(recovered_rows),
+        }
+        if near_misses:
+            headers["X-Match-Near-Misses"] = str(len(match_report.near_misses))
+        
+        return RangeFileResponse(
+            str(stored.path),
+            stored.size,
+            stored.filename,
+            headers=headers
+        )
         
-        return StreamingResponse(
-            output,
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f'attachment; filename="{output_filename}"'
-            }
+    except MemoryLimitExceeded as e:
+        logger.warning(f"Arquivo recusado por tamanho: {file.filename} - {e}")
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
+        
+    except MemoryBudgetTimeout as e:
+        logger.warning(f"Fila de memória esgotada para {file.filename}: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(MEMORY_QUEUE_TIMEOUT))}
         )
         
     except ValueError as e:
@@ -175,6 +357,236 @@ async def process_file(
         )
 
 
+def period_from_filename(filename: str) -> str:
+    """
+    Deriva o nome do período a partir do arquivo (ex.: processado_2024-01.xlsx -> 2024-01).
+    """
+    period = filename.rsplit("/", 1)[-1]
+    if period.lower().endswith(".xlsx"):
+        period = period[:-len(".xlsx")]
+    if period.startswith("processado_"):
+        period = period[len("processado_"):]
+    return period
+
+
+def spool_consolidation_inputs(files: list[UploadFile], directory: str) -> tuple[list[tuple[str, str]], int]:
+    """
+    Copia os uploads para arquivos nomeados em `directory` (os processos de
+    leitura recebem o caminho) e estima a memória da consolidação.
+
+    Cada processo mantém uma leitura e o consumidor ainda referencia a partição
+    anterior, então reserva as `CONSOLIDATION_MAX_WORKERS + 1` maiores entradas
+    mais o overhead de cada processo.
+    """
+    inputs = []
+    estimates = []
+    for index, file in enumerate(files):
+        path = os.path.join(directory, f"{index:04d}.xlsx")
+        file.file.seek(0)
+        with open(path, "wb") as spooled:
+            shutil.copyfileobj(file.file, spooled)
+        inputs.append((period_from_filename(file.filename), path))
+        estimates.append(estimate_workbook_memory(path).streaming_bytes)
+
+    workers = min(CONSOLIDATION_MAX_WORKERS, len(inputs))
+    estimates.sort(reverse=True)
+    estimated_bytes = sum(estimates[:workers + 1]) + workers * WORKER_PROCESS_MEMORY_BYTES
+    return inputs, estimated_bytes
+
+
+@app.post("/consolidate")
+async def consolidate_files(
+    files: list[UploadFile] = File(...),
+    compression_level: int = Query(None, ge=MIN_COMPRESSION_LEVEL, le=MAX_COMPRESSION_LEVEL),
+    match_mode: str = Query(None, pattern=MATCH_MODE_PATTERN),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Consolida vários arquivos (um por período) em um relatório com Overview por período.
+    
+    O período de cada arquivo é o nome do arquivo sem extensão (e sem o prefixo
+    "processado_"); a ordem do upload é a ordem no Overview.
+    
+    Args:
+        files: Arquivos Excel (.xlsx), originais ou já processados
+        compression_level: Nível de compressão do .xlsx gerado (0-9, padrão: ZIP_COMPRESSION_LEVEL)
+        match_mode: Comparação do ESTABELECIMENTO ("exact" ou "normalized", padrão: MATCH_MODE)
+        api_key: API Key validada (via dependency injection)
+        
+    Returns:
+        RangeFileResponse com o arquivo consolidado (também disponível em /results/{X-Result-Id})
+        
+    Raises:
+        HTTPException 401: Se a API Key não for fornecida ou for inválida
+        HTTPException 400: Se algum arquivo não for .xlsx ou tiver estrutura inválida
+        HTTPException 413: Se a memória estimada exceder o limite por requisição
+        HTTPException 503: Se não houver memória livre após o tempo máximo na fila
+        HTTPException 500: Se ocorrer erro durante o processamento
+    """
+    invalid = [file.filename for file in files if not file.filename.endswith('.xlsx')]
+    if invalid:
+        logger.warning(f"Tentativa de consolidação com arquivos inválidos: {invalid}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Apenas arquivos .xlsx são suportados: {', '.join(invalid)}"
+        )
+    
+    logger.info(f"Iniciando consolidação de {len(files)} arquivos")
+    
+    try:
+        # Os uploads vão para arquivos nomeados (em disco, fora do event loop) e
+        # cada um só é lido quando o processo da consolidação começa
+        with tempfile.TemporaryDirectory(prefix="consolidate_") as directory:
+            inputs, estimated_bytes = await run_in_threadpool(spool_consolidation_inputs, files, directory)
+            logger.info(f"Memória estimada para consolidação: {estimated_bytes // MB} MB")
+            
+            if compression_level is None:
+                compression_level = ZIP_COMPRESSION_LEVEL
+            
+            async with memory_guard.reserve(estimated_bytes):
+                output = await run_in_threadpool(
+                    consolidate_excel, inputs, CONSOLIDATION_MAX_WORKERS, compression_level, match_mode or MATCH_MODE
+                )
+        logger.info(f"Consolidação concluída com sucesso ({len(files)} períodos)")
+        
+        stored = await run_in_threadpool(result_store.save, output, CONSOLIDATED_FILENAME)
+        output.close()
+        
+        return RangeFileResponse(
+            str(stored.path),
+            stored.size,
+            stored.filename,
+            headers={"X-Result-Id": stored.result_id}
+        )
+        
+    except MemoryLimitExceeded as e:
+        logger.warning(f"Consolidação recusada por tamanho: {e}")
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
+        
+    except MemoryBudgetTimeout as e:
+        logger.warning(f"Fila de memória esgotada para consolidação: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(MEMORY_QUEUE_TIMEOUT))}
+        )
+        
+    except ValueError as e:
+        logger.error(f"Erro de validação na consolidação: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Erro de validação: {str(e)}"
+        )
+        
+    except Exception as e:
+        logger.error(f"Erro inesperado na consolidação: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro ao consolidar os arquivos: {str(e)}"
+        )
+
+
+@app.post("/match-report")
+async def match_report(
+    file: UploadFile = File(...),
+    match_mode: str = Query(None, pattern=MATCH_MODE_PATTERN),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Relatório da comparação do ESTABELECIMENTO com os filtros, sem processar o arquivo.
+    
+    Lista as linhas aceitas por filtro, os valores aceitos só pela normalização
+    e os valores descartados parecidos com algum filtro (near misses).
+    
+    Args:
+        file: Arquivo Excel (.xlsx)
+        match_mode: "exact" ou "normalized" (padrão: MATCH_MODE)
+        api_key: API Key validada (via dependency injection)
+        
+    Raises:
+        HTTPException 400: Se o arquivo não for .xlsx ou não tiver a coluna ESTABELECIMENTO
+        HTTPException 413/503: Controle de memória (ver POST /process)
+    """
+    if not file.filename.endswith('.xlsx'):
+        raise HTTPException(
+            status_code=400,
+            detail="Apenas arquivos .xlsx são suportados"
+        )
+    
+    try:
+        file_bytes = await file.read()
+        estimate = estimate_workbook_memory(file_bytes)
+        async with memory_guard.reserve(estimate.streaming_bytes):
+            report = await run_in_threadpool(build_match_report, file_bytes, match_mode or MATCH_MODE)
+        return report.to_dict()
+        
+    except MemoryLimitExceeded as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
+        
+    except MemoryBudgetTimeout as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(MEMORY_QUEUE_TIMEOUT))}
+        )
+        
+    except ValueError as e:
+        logger.error(f"Erro de validação no relatório de {file.filename}: {e}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Erro de validação: {str(e)}"
+        )
+
+
+@app.api_route("/results/{result_id}", methods=["GET", "HEAD"])
+async def download_result(
+    result_id: str,
+    range_header: str = Header(None, alias="range"),
+    api_key: str = Depends(verify_api_key)
+):
+    """
+    Baixa novamente um resultado processado (suporta HEAD e Range para retomar downloads).
+    
+    Args:
+        result_id: ID retornado no header X-Result-Id do POST /process
+        range_header: Header Range opcional (ex.: bytes=1048576-)
+        api_key: API Key validada (via dependency injection)
+        
+    Raises:
+        HTTPException 404: Se o resultado não existir ou tiver expirado
+        HTTPException 416: Se o intervalo solicitado não for satisfazível
+    """
+    stored = result_store.get(result_id)
+    if not stored:
+        raise HTTPException(
+            status_code=404,
+            detail="Resultado não encontrado ou expirado"
+        )
+    
+    try:
+        byte_range = parse_range_header(range_header, stored.size)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=416,
+            detail=str(e),
+            headers={"Content-Range": f"bytes */{stored.size}"}
+        )
+    
+    return RangeFileResponse(
+        str(stored.path),
+        stored.size,
+        stored.filename,
+        byte_range=byte_range,
+        headers={"X-Result-Id": stored.result_id}
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
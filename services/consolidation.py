@@ -0,0 +1,369 @@
+"""
+Consolidation Service
+Consolida vários relatórios (ex.: mensais) em um único arquivo com Overview
+por período e totais, reaproveitando a separação em blocos do Detalhado.
+
+Cada entrada é lida em streaming (openpyxl read_only) em um processo
+separado, mantendo apenas as linhas filtradas, e a saída é gravada em modo
+write_only. Processos (e não threads) porque o parsing do XML é Python puro
+e segura o GIL.
+"""
+from __future__ import annotations
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from io import BytesIO
+from typing import Union
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from services.excel_processor import (
+    BLOCK_RESGATE_CHECKOUT,
+    BLOCK_RESGATE_SEM_CHECKOUT,
+    BLOCK_TARIFA_CHECKOUT,
+    BLOCK_TARIFA_SEM_CHECKOUT,
+    CENTER_SHEET_NAME,
+    CHECKOUT_COLUMN,
+    COLUMN_ESTABELECIMENTO,
+    COST_DIVIDER_EMPRESA,
+    COST_DIVIDER_FOLHA,
+    COST_FILTER_VALUE,
+    COST_HEADER_DEBITO,
+    COST_HEADER_DEBITO_ACCENT,
+    COST_SHEET_NAME,
+    DISCOUNT_FILTER_VALUE,
+    DISCOUNT_SHEET_NAME,
+    MATCH_MODE_EXACT,
+    OVERVIEW_A_DEBITAR_LABEL,
+    OVERVIEW_CHECKOUT_EMPRESA_LABEL,
+    OVERVIEW_CHECKOUT_FOLHA_LABEL,
+    OVERVIEW_CUSTO_EMPRESA_LABEL,
+    OVERVIEW_SHEET_NAME,
+    OVERVIEW_TOTAL_FECHAMENTO_LABEL,
+    OVERVIEW_TOTAL_FUNC_LABEL,
+    OVERVIEW_TOTAL_LABEL,
+    canonical_estabelecimento,
+    classify_detailed_row,
+    save_workbook_to_buffer,
+    validate_match_mode,
+)
+from services.text_normalization import normalize_text
+
+
+# =====================
+# Constantes
+# =====================
+PERIOD_HEADER = "PERÍODO"
+OVERVIEW_PERIOD_LABEL = "Período"
+OVERVIEW_GRAND_TOTAL_LABEL = "TOTAL CONSOLIDADO"
+DEFAULT_MAX_WORKERS = 4
+CURRENCY_FORMAT = '"R$" #,##0.00'
+
+# Entrada de um período: bytes ou caminho do .xlsx (precisa ir por pickle para o worker)
+PeriodSource = Union[bytes, str, os.PathLike]
+
+# Ordem dos blocos na aba "Custo empresa" (divisor exibido antes do bloco)
+COST_BLOCK_LAYOUT = (
+    (BLOCK_TARIFA_SEM_CHECKOUT, None),
+    (BLOCK_TARIFA_CHECKOUT, COST_DIVIDER_EMPRESA),
+    (BLOCK_RESGATE_CHECKOUT, COST_DIVIDER_FOLHA),
+)
+
+
+# Headers aceitos para a coluna de débito (todos viram a mesma coluna na consolidação)
+DEBITO_HEADERS = {COST_HEADER_DEBITO, COST_HEADER_DEBITO_ACCENT}
+_DEBITO_KEY = normalize_text(COST_HEADER_DEBITO)
+_DEBITO_ALIASES = {normalize_text(label) for label in DEBITO_HEADERS}
+
+
+@dataclass
+class PeriodPartition:
+    """
+    Linhas filtradas do Detalhado de um período, já separadas em blocos.
+
+    `keys` são os headers normalizados (com os aliases de débito unificados),
+    usados para alinhar as colunas entre períodos.
+    """
+    period: str
+    header: list[str]
+    keys: list[str] = field(default_factory=list)
+    blocks: dict[str, list[tuple]] = field(default_factory=dict)
+
+
+# =====================
+# Leitura em Streaming
+# =====================
+def _find_index(header: list[str], labels: set[str]) -> int | None:
+    normalized = {normalize_text(label) for label in labels}
+    for index, value in enumerate(header):
+        if normalize_text(value) in normalized:
+            return index
+    return None
+
+
+def _column_key(label: str) -> str:
+    key = normalize_text(label)
+    return _DEBITO_KEY if key in _DEBITO_ALIASES else key
+
+
+def read_period_partition(
+    period: str, source: PeriodSource, match_mode: str = MATCH_MODE_EXACT
+) -> PeriodPartition:
+    """
+    Lê a aba Detalhado em streaming e guarda apenas as linhas de custo/desconto.
+
+    Args:
+        period: Nome do período (ex.: "2024-01")
+        source: Arquivo Excel (.xlsx), original ou já processado: bytes ou caminho.
+            Caminhos só são lidos aqui, no worker.
+        match_mode: Comparação do ESTABELECIMENTO com os filtros ("exact" ou "normalized")
+
+    Returns:
+        PeriodPartition com as linhas de cada bloco
+
+    Raises:
+        ValueError: Se a aba Detalhado ou as colunas obrigatórias (ESTABELECIMENTO,
+            CHECKOUT, débito) não forem encontradas
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = BytesIO(source)
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        if CENTER_SHEET_NAME not in workbook.sheetnames:
+            raise ValueError(f"Aba '{CENTER_SHEET_NAME}' não encontrada no período '{period}'.")
+
+        rows = workbook[CENTER_SHEET_NAME].iter_rows(values_only=True)
+        header_row = next(rows, None)
+        if not header_row:
+            raise ValueError(f"Aba '{CENTER_SHEET_NAME}' vazia no período '{period}'.")
+
+        # Remove colunas vazias à direita (dimension maior que os dados)
+        header = list(header_row)
+        while header and header[-1] in (None, ""):
+            header.pop()
+        header = ["" if value is None else str(value) for value in header]
+
+        est_index = _find_index(header, {COLUMN_ESTABELECIMENTO})
+        checkout_index = _find_index(header, {CHECKOUT_COLUMN})
+        debito_index = _find_index(header, DEBITO_HEADERS)
+        missing = [
+            label for label, index in (
+                (COLUMN_ESTABELECIMENTO, est_index),
+                (CHECKOUT_COLUMN, checkout_index),
+                (COST_HEADER_DEBITO, debito_index),
+            ) if index is None
+        ]
+        if missing:
+            raise ValueError(
+                f"Colunas obrigatórias não encontradas no Detalhado do período '{period}': "
+                f"{', '.join(missing)}."
+            )
+
+        partition = PeriodPartition(period=period, header=header, keys=[_column_key(value) for value in header])
+        width = len(header)
+        for row in rows:
+            if len(row) <= max(est_index, checkout_index):
+                continue
+            block = classify_detailed_row(row[est_index], row[checkout_index], match_mode)
+            if block is None:
+                continue
+            values = list(row[:width]) + [None] * (width - len(row))
+            # Valor canônico do filtro, para os SUMIFS do Overview baterem
+            values[est_index] = canonical_estabelecimento(row[est_index], match_mode)
+            partition.blocks.setdefault(block, []).append(tuple(values))
+        return partition
+    finally:
+        workbook.close()
+
+
+@lru_cache(maxsize=None)
+def _process_context():
+    """
+    Contexto dos processos de leitura. Com forkserver, o servidor de fork já
+    importa este módulo (pandas/openpyxl) uma vez e cada worker nasce pronto;
+    sem ele (Windows/macOS antigos), spawn.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def iter_partitions(inputs: list[tuple[str, PeriodSource]], max_workers: int, match_mode: str = MATCH_MODE_EXACT):
+    """
+    Lê as entradas em paralelo (um processo por leitura) devolvendo as
+    partições na ordem de entrada.
+
+    Uma nova leitura só é submetida quando o consumidor pede a próxima
+    partição, então ficam em memória no máximo `max_workers` leituras em
+    andamento/concluídas mais a partição que o consumidor ainda referencia
+    (`max_workers + 1`). Caminhos só são abertos quando o worker começa.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=_process_context()) as executor:
+        pending = deque()
+        queue = iter(inputs)
+        for period, source in queue:
+            pending.append(executor.submit(read_period_partition, period, source, match_mode))
+            if len(pending) >= max_workers:
+                break
+        while pending:
+            yield pending.popleft().result()
+            next_input = next(queue, None)
+            if next_input is not None:
+                pending.append(executor.submit(read_period_partition, *next_input, match_mode))
+
+
+# =====================
+# Escrita
+# =====================
+def _bold_row(sheet, values: list) -> list:
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True)
+        cells.append(cell)
+    return cells
+
+
+def _currency_row(sheet, values: list) -> list:
+    cells = []
+    for index, value in enumerate(values):
+        cell = WriteOnlyCell(sheet, value=value)
+        if index > 0:
+            cell.number_format = CURRENCY_FORMAT
+        cells.append(cell)
+    return cells
+
+
+def _aligned(row: tuple, source_keys: list[str], column_keys: list[str]) -> list:
+    """
+    Reordena a linha para as colunas do primeiro período (por header normalizado).
+    Colunas opcionais ausentes no período ficam vazias.
+    """
+    if source_keys == column_keys:
+        return list(row)
+    positions = {}
+    for index, key in enumerate(source_keys):
+        positions.setdefault(key, index)
+    return [row[positions[key]] if key in positions else None for key in column_keys]
+
+
+def consolidate_excel(
+    inputs: list[tuple[str, PeriodSource]],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    compression_level: int | None = None,
+    match_mode: str = MATCH_MODE_EXACT,
+) -> BytesIO:
+    """
+    Consolida vários arquivos em um único relatório multi-período.
+
+    Gera as abas:
+        - Overview: uma linha por período (fórmulas SUMIFS por PERÍODO) e o total consolidado
+        - Custo empresa: blocos TARIFA/RESGATE de cada período, com a coluna PERÍODO
+        - Desconto folha: RESGATE sem checkout de cada período, com a coluna PERÍODO
+
+    Args:
+        inputs: Lista de (período, .xlsx em bytes ou caminho), na ordem desejada no Overview
+        max_workers: Quantidade de arquivos lidos em paralelo (processos)
+        compression_level: Nível de compressão do arquivo gerado (0-9, None = padrão)
+        match_mode: Comparação do ESTABELECIMENTO com os filtros ("exact" ou "normalized")
+
+    Returns:
+        BytesIO contendo o arquivo consolidado
+
+    Raises:
+        ValueError: Se não houver entradas, períodos repetidos ou estrutura inválida
+    """
+    validate_match_mode(match_mode)
+    if not inputs:
+        raise ValueError("Nenhum arquivo informado para consolidação.")
+    periods = [period for period, _ in inputs]
+    duplicated = sorted({period for period in periods if periods.count(period) > 1})
+    if duplicated:
+        raise ValueError(f"Períodos repetidos: {', '.join(duplicated)}")
+
+    workbook = Workbook(write_only=True)
+    overview_sheet = workbook.create_sheet(OVERVIEW_SHEET_NAME)
+    cost_sheet = workbook.create_sheet(COST_SHEET_NAME)
+    discount_sheet = workbook.create_sheet(DISCOUNT_SHEET_NAME)
+
+    columns = column_keys = None
+    for partition in iter_partitions(inputs, max(1, max_workers), match_mode):
+        if columns is None:
+            columns, column_keys = partition.header, partition.keys
+            header = [PERIOD_HEADER] + columns
+            cost_sheet.append(_bold_row(cost_sheet, header))
+            discount_sheet.append(_bold_row(discount_sheet, header))
+
+        for block, divider in COST_BLOCK_LAYOUT:
+            if divider:
+                cost_sheet.append([partition.period, divider])
+            for row in partition.blocks.get(block, []):
+                cost_sheet.append([partition.period] + _aligned(row, partition.keys, column_keys))
+
+        for row in partition.blocks.get(BLOCK_RESGATE_SEM_CHECKOUT, []):
+            discount_sheet.append([partition.period] + _aligned(row, partition.keys, column_keys))
+
+    # === Colunas usadas nas fórmulas (PERÍODO fica na coluna A) ===
+    # (garantidas em todos os períodos por read_period_partition)
+    debito_index = _find_index(columns, DEBITO_HEADERS)
+    est_index = _find_index(columns, {COLUMN_ESTABELECIMENTO})
+    checkout_index = _find_index(columns, {CHECKOUT_COLUMN})
+
+    debito_col = get_column_letter(debito_index + 2)
+    est_col = get_column_letter(est_index + 2)
+    checkout_col = get_column_letter(checkout_index + 2)
+
+    def cost_range(column: str) -> str:
+        return f"'{COST_SHEET_NAME}'!{column}:{column}"
+
+    def discount_range(column: str) -> str:
+        return f"'{DISCOUNT_SHEET_NAME}'!{column}:{column}"
+
+    # === Overview por período ===
+    overview_sheet.append(_bold_row(overview_sheet, [
+        OVERVIEW_PERIOD_LABEL,
+        OVERVIEW_CHECKOUT_FOLHA_LABEL,
+        OVERVIEW_CHECKOUT_EMPRESA_LABEL,
+        OVERVIEW_CUSTO_EMPRESA_LABEL,
+        OVERVIEW_TOTAL_LABEL,
+        OVERVIEW_A_DEBITAR_LABEL,
+        OVERVIEW_TOTAL_FUNC_LABEL,
+        OVERVIEW_TOTAL_FECHAMENTO_LABEL,
+    ]))
+
+    first_row = 2
+    for row_number, period in enumerate(periods, start=first_row):
+        period_ref = f"$A{row_number}"
+        by_period = f"{cost_range('A')},{period_ref}"
+        overview_sheet.append(_currency_row(overview_sheet, [
+            period,
+            f"=SUMIFS({cost_range(debito_col)},{by_period},"
+            f"{cost_range(est_col)},\"{DISCOUNT_FILTER_VALUE}\",{cost_range(checkout_col)},\"<>\")",
+            f"=SUMIFS({cost_range(debito_col)},{by_period},"
+            f"{cost_range(est_col)},\"{COST_FILTER_VALUE}\",{cost_range(checkout_col)},\"<>\")",
+            f"=SUMIFS({cost_range(debito_col)},{by_period},"
+            f"{cost_range(est_col)},\"{COST_FILTER_VALUE}\",{cost_range(checkout_col)},\"=\")",
+            f"=SUM(B{row_number}:D{row_number})",
+            f"=SUMIFS({discount_range(debito_col)},{discount_range('A')},{period_ref})",
+            f"=F{row_number}",
+            f"=E{row_number}+G{row_number}",
+        ]))
+
+    last_row = first_row + len(periods) - 1
+    total_row = _currency_row(overview_sheet, [OVERVIEW_GRAND_TOTAL_LABEL] + [
+        f"=SUM({column}{first_row}:{column}{last_row})" for column in "BCDEFGH"
+    ])
+    for cell in total_row:
+        cell.font = Font(bold=True)
+    overview_sheet.append(total_row)
+
+    return save_workbook_to_buffer(workbook, compression_level)
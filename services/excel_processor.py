@@ -7,11 +7,23 @@ from __future__ import annotations
 
 from io import BytesIO
 from copy import copy
-import unicodedata
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from difflib import SequenceMatcher
+from zipfile import ZipFile, ZIP_DEFLATED
 
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
 from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.writer.excel import ExcelWriter
+
+from services.text_normalization import (
+    collapse_spaces,
+    normalize_match_key,
+    normalize_series,
+    normalize_text,
+)
 
 
 # =====================
@@ -27,6 +39,25 @@ DISCOUNT_SHEET_NAME = "Desconto folha"
 COST_FILTER_VALUE = "TARIFA RESGATE LIMITE PARA FLEX"
 DISCOUNT_FILTER_VALUE = "RESGATE LIMITE PARA FLEX"
 
+# Modos de comparação do ESTABELECIMENTO com os filtros
+MATCH_MODE_EXACT = "exact"  # Igualdade exata (comportamento original)
+MATCH_MODE_NORMALIZED = "normalized"  # Ignora espaços extras, caixa e acentos
+MATCH_MODES = (MATCH_MODE_EXACT, MATCH_MODE_NORMALIZED)
+
+# Similaridade mínima (0-1) para um valor descartado aparecer como "quase igual" no relatório
+NEAR_MISS_CUTOFF = 0.85
+MAX_NEAR_MISSES = 50
+
+# Blocos do Detalhado (ESTABELECIMENTO x CHECKOUT preenchido)
+BLOCK_TARIFA_SEM_CHECKOUT = "tarifa_sem_checkout"  # Custo empresa - topo
+BLOCK_TARIFA_CHECKOUT = "tarifa_checkout"  # Custo empresa - meio
+BLOCK_RESGATE_CHECKOUT = "resgate_checkout"  # Custo empresa - fim
+BLOCK_RESGATE_SEM_CHECKOUT = "resgate_sem_checkout"  # Desconto folha
+
+# Labels divisores da aba "Custo empresa"
+COST_DIVIDER_EMPRESA = "Checkouts Empresa"
+COST_DIVIDER_FOLHA = "Checkouts Folha colab"
+
 OVERVIEW_SHEET_NAME = "Overview"
 
 # Labels existentes no arquivo ORIGINAL
@@ -49,23 +80,14 @@ COST_HEADER_CHECKOUT = "CHECKOUT"
 COST_HEADER_DEBITO = "DEBITO EM FOLHA"
 COST_HEADER_DEBITO_ACCENT = "DÉBITO EM FOLHA"
 
+# Nível de compressão do zip de saída (0 = sem compressão, 9 = máxima; None = padrão do zlib)
+MIN_COMPRESSION_LEVEL = 0
+MAX_COMPRESSION_LEVEL = 9
+
 
 # =====================
 # Helpers
 # =====================
-def normalize_text(value: object) -> str:
-    """
-    Normaliza texto removendo acentos, convertendo para lowercase e removendo espaços.
-    """
-    if value is None:
-        return ""
-    text = str(value).strip().lower()
-    return "".join(
-        c for c in unicodedata.normalize("NFD", text)
-        if unicodedata.category(c) != "Mn"
-    )
-
-
 def find_label_cell(sheet, label: str):
     """
     Procura uma célula contendo o label especificado (normalizado).
@@ -73,7 +95,7 @@ def find_label_cell(sheet, label: str):
     target = normalize_text(label)
     for row in sheet.iter_rows():
         for cell in row:
-            if normalize_text(cell.value) == target:
+            if cell.value is not None and normalize_text(cell.value) == target:
                 return cell
     return None
 
@@ -127,15 +149,269 @@ def compress_blank_rows_visual(sheet, start_row: int, end_row: int, blank_height
             sheet.row_dimensions[r].height = blank_height
 
 
+_FILTER_VALUES = (COST_FILTER_VALUE, DISCOUNT_FILTER_VALUE)
+_EXACT_FILTERS = {value: value for value in _FILTER_VALUES}
+_NORMALIZED_FILTERS = {normalize_match_key(value): value for value in _FILTER_VALUES}
+
+
+@dataclass
+class MatchReport:
+    """
+    Resultado da comparação da coluna ESTABELECIMENTO com os filtros.
+
+    Attributes:
+        mode: Modo de comparação usado
+        matched_rows: Linhas aceitas por filtro
+        recovered: Valores aceitos apenas graças à normalização (≠ do filtro literal)
+        near_misses: Valores descartados parecidos com algum filtro (possível erro de digitação)
+    """
+    mode: str
+    matched_rows: dict[str, int] = field(default_factory=dict)
+    recovered: list[dict] = field(default_factory=list)
+    near_misses: list[dict] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def validate_match_mode(match_mode: str) -> None:
+    if match_mode not in MATCH_MODES:
+        raise ValueError(f"Modo de comparação inválido: {match_mode} (use {', '.join(MATCH_MODES)}).")
+
+
+def canonical_estabelecimento(value: object, match_mode: str = MATCH_MODE_EXACT) -> str | None:
+    """
+    Retorna o filtro (COST/DISCOUNT) correspondente ao valor, ou None.
+    """
+    if match_mode == MATCH_MODE_NORMALIZED:
+        return _NORMALIZED_FILTERS.get(normalize_match_key(value)) if value is not None else None
+    return _EXACT_FILTERS.get(value) if isinstance(value, str) else None
+
+
+def _near_miss_matchers() -> list[tuple[SequenceMatcher, int, str]]:
+    """
+    Um SequenceMatcher por filtro com o filtro como seq2 (índice calculado uma vez).
+    Criados por chamada: o SequenceMatcher guarda estado e não é thread-safe.
+    """
+    return [
+        (SequenceMatcher(None, "", normalized_filter), len(normalized_filter), filter_value)
+        for normalized_filter, filter_value in _NORMALIZED_FILTERS.items()
+    ]
+
+
+def _closest_filter(normalized_value: str, matchers: list) -> tuple[str | None, float]:
+    best, best_ratio = None, 0.0
+    length = len(normalized_value)
+    for matcher, filter_length, filter_value in matchers:
+        # Limite superior do ratio pelo tamanho (2 * menor / soma), sem tocar no texto
+        total = length + filter_length
+        if not total or 2 * min(length, filter_length) < NEAR_MISS_CUTOFF * total:
+            continue
+        matcher.set_seq1(normalized_value)
+        if matcher.quick_ratio() < NEAR_MISS_CUTOFF:
+            continue
+        ratio = matcher.ratio()
+        if ratio > best_ratio:
+            best, best_ratio = filter_value, ratio
+    return best, best_ratio
+
+
+def match_estabelecimento(
+    values: pd.Series, match_mode: str = MATCH_MODE_EXACT, near_misses: bool = False
+) -> tuple[pd.Series, MatchReport]:
+    """
+    Compara a coluna ESTABELECIMENTO com os filtros de custo/desconto.
+
+    Cada valor distinto (factorize) é comparado, e normalizado no modo
+    "normalized", uma única vez.
+
+    Args:
+        values: Coluna ESTABELECIMENTO do Detalhado
+        match_mode: "exact" ou "normalized"
+        near_misses: Procura valores descartados parecidos com os filtros. É a parte
+            cara (SequenceMatcher por valor distinto), por isso só roda quando pedida.
+
+    Returns:
+        (Série com o filtro correspondente a cada linha ou None, MatchReport)
+
+    Raises:
+        ValueError: Se o modo de comparação for inválido
+    """
+    validate_match_mode(match_mode)
+
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    uniques = pd.Series(uniques, dtype=object)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+    # No modo exato sem near misses não há nada para normalizar
+    keys = None
+    if match_mode == MATCH_MODE_NORMALIZED or near_misses:
+        keys = normalize_series(uniques).map(collapse_spaces)
+    if match_mode == MATCH_MODE_NORMALIZED:
+        matches = keys.map(_NORMALIZED_FILTERS)
+    else:
+        matches = uniques.map(_EXACT_FILTERS)
+    matched = matches.notna().to_numpy()
+    matches = matches.astype(object).where(matched, None).tolist()
+
+    # Sentinela -1 (célula vazia) aponta para o None no fim do array
+    canonical_by_code = np.array(matches + [None], dtype=object)
+    canonical = pd.Series(canonical_by_code[codes], index=values.index, name=values.name, dtype=object)
+
+    report = MatchReport(mode=match_mode, matched_rows={value: 0 for value in _FILTER_VALUES})
+    raw_values = uniques.tolist()
+    for index in np.flatnonzero(matched):
+        raw, rows = raw_values[index], int(counts[index])
+        report.matched_rows[matches[index]] += rows
+        if raw != matches[index]:
+            report.recovered.append({"value": str(raw), "rows": rows, "matched": matches[index]})
+
+    if not near_misses:
+        return canonical, report
+
+    matchers = _near_miss_matchers()
+    keys = keys.tolist()
+    for index in np.flatnonzero(~matched):
+        raw, key, rows = raw_values[index], keys[index], int(counts[index])
+        closest, similarity = _closest_filter(key, matchers)
+        if closest:
+            report.near_misses.append({
+                "value": str(raw),
+                "rows": rows,
+                "closest": closest,
+                "similarity": round(similarity, 3),
+            })
+
+    report.near_misses.sort(key=lambda item: (-item["similarity"], -item["rows"]))
+    del report.near_misses[MAX_NEAR_MISSES:]
+    return canonical, report
+
+
+def is_checkout_filled(value: object) -> bool:
+    """
+    Versão por célula da máscara de checkout (valor presente e não vazio).
+    """
+    return value is not None and str(value).strip() != ""
+
+
+def classify_detailed_row(
+    estabelecimento: object, checkout: object, match_mode: str = MATCH_MODE_EXACT
+) -> str | None:
+    """
+    Classifica uma linha do Detalhado em um dos blocos (ou None se não entra em nenhum).
+    Usado no processamento em streaming; equivale a `partition_detailed`.
+    """
+    canonical = canonical_estabelecimento(estabelecimento, match_mode)
+    if canonical == COST_FILTER_VALUE:
+        return BLOCK_TARIFA_CHECKOUT if is_checkout_filled(checkout) else BLOCK_TARIFA_SEM_CHECKOUT
+    if canonical == DISCOUNT_FILTER_VALUE:
+        return BLOCK_RESGATE_CHECKOUT if is_checkout_filled(checkout) else BLOCK_RESGATE_SEM_CHECKOUT
+    return None
+
+
+def partition_detailed(
+    detailed: pd.DataFrame, match_mode: str = MATCH_MODE_EXACT, near_misses: bool = False
+) -> tuple[dict[str, pd.DataFrame], MatchReport]:
+    """
+    Separa a aba Detalhado nos blocos usados pelas abas "Custo empresa" e "Desconto folha".
+
+    No modo "normalized", as linhas aceitas recebem o valor canônico do filtro em
+    ESTABELECIMENTO, para que os SUMIFS do Overview continuem batendo.
+    """
+    canonical, report = match_estabelecimento(detailed[COLUMN_ESTABELECIMENTO], match_mode, near_misses)
+    if report.recovered:
+        detailed = detailed.assign(**{
+            COLUMN_ESTABELECIMENTO: canonical.where(canonical.notna(), detailed[COLUMN_ESTABELECIMENTO])
+        })
+
+    # Máscara: True se tiver checkout (data preenchida), False se vazio
+    checkout_filled = (
+        detailed[CHECKOUT_COLUMN].notna()
+        & detailed[CHECKOUT_COLUMN].astype(str).str.strip().ne("")
+    )
+    is_tarifa = canonical == COST_FILTER_VALUE
+    is_resgate = canonical == DISCOUNT_FILTER_VALUE
+
+    blocks = {
+        BLOCK_TARIFA_SEM_CHECKOUT: detailed[is_tarifa & ~checkout_filled],
+        BLOCK_TARIFA_CHECKOUT: detailed[is_tarifa & checkout_filled],
+        BLOCK_RESGATE_CHECKOUT: detailed[is_resgate & checkout_filled],
+        BLOCK_RESGATE_SEM_CHECKOUT: detailed[is_resgate & ~checkout_filled],
+    }
+    return blocks, report
+
+
+def save_workbook_to_buffer(workbook, compression_level: int | None = None) -> BytesIO:
+    """
+    Salva o workbook em memória com nível de compressão configurável.
+
+    Equivalente ao `workbook.save`, mas permite trocar CPU por bytes trafegados.
+    """
+    if compression_level is not None and not (
+        MIN_COMPRESSION_LEVEL <= compression_level <= MAX_COMPRESSION_LEVEL
+    ):
+        raise ValueError(
+            f"Nível de compressão inválido: {compression_level} "
+            f"(use {MIN_COMPRESSION_LEVEL} a {MAX_COMPRESSION_LEVEL})."
+        )
+
+    output_buffer = BytesIO()
+    archive = ZipFile(output_buffer, "w", ZIP_DEFLATED, allowZip64=True, compresslevel=compression_level)
+    workbook.properties.modified = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    ExcelWriter(workbook, archive).save()
+    output_buffer.seek(0)  # Garantir que o cursor está no início
+    return output_buffer
+
+
 # =====================
 # Processamento Principal
 # =====================
-def process_excel(file_bytes: bytes) -> BytesIO:
+def read_detailed_column(file_bytes: bytes, column: str) -> pd.Series:
+    """
+    Lê uma única coluna do Detalhado em streaming (openpyxl read_only), sem
+    carregar a aba inteira como o `pd.read_excel` faz mesmo com `usecols`.
+
+    Raises:
+        ValueError: Se a aba Detalhado ou a coluna não forem encontradas
+    """
+    workbook = load_workbook(BytesIO(file_bytes), read_only=True, data_only=True)
+    try:
+        if CENTER_SHEET_NAME not in workbook.sheetnames:
+            raise ValueError(f"Aba '{CENTER_SHEET_NAME}' não encontrada.")
+        rows = workbook[CENTER_SHEET_NAME].iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        if column not in header:
+            raise ValueError(f"Coluna '{column}' não encontrada na aba '{CENTER_SHEET_NAME}'.")
+        index = header.index(column)
+        values = [row[index] if len(row) > index else None for row in rows]
+    finally:
+        workbook.close()
+    return pd.Series(values, name=column, dtype=object)
+
+
+def build_match_report(file_bytes: bytes, match_mode: str = MATCH_MODE_EXACT) -> MatchReport:
+    """
+    Gera apenas o relatório de comparação do ESTABELECIMENTO (sem processar o arquivo).
+    
+    Raises:
+        ValueError: Se o modo for inválido ou a coluna não existir no Detalhado
+    """
+    validate_match_mode(match_mode)
+    values = read_detailed_column(file_bytes, COLUMN_ESTABELECIMENTO)
+    _, report = match_estabelecimento(values, match_mode, near_misses=True)
+    return report
+
+
+def process_excel(
+    file_bytes: bytes, compression_level: int | None = None, match_mode: str = MATCH_MODE_EXACT
+) -> BytesIO:
     """
     Processa um arquivo Excel aplicando regras de negócio específicas.
     
     Args:
         file_bytes: Bytes do arquivo Excel (.xlsx)
+        compression_level: Nível de compressão do arquivo gerado (0-9, None = padrão)
+        match_mode: Comparação do ESTABELECIMENTO com os filtros ("exact" ou "normalized")
         
     Returns:
         BytesIO contendo o arquivo Excel processado
@@ -144,57 +420,48 @@ def process_excel(file_bytes: bytes) -> BytesIO:
         ValueError: Se campos obrigatórios não forem encontrados
         Exception: Para outros erros de processamento
     """
-    excel_file = pd.ExcelFile(BytesIO(file_bytes))
-
-    detailed = pd.read_excel(excel_file, sheet_name=CENTER_SHEET_NAME)
+    output, _ = process_excel_with_report(file_bytes, compression_level, match_mode)
+    return output
 
-    # Máscara: True se tiver checkout (data preenchida), False se vazio
-    checkout_filled = (
-        detailed[CHECKOUT_COLUMN].notna()
-        & detailed[CHECKOUT_COLUMN].astype(str).str.strip().ne("")
-    )
 
-    # === BLOCO 1 (TOPO): TARIFA SEM DATA DE CHECKOUT ===
-    cost_tarifa_no_checkout = detailed[
-        (detailed[COLUMN_ESTABELECIMENTO] == COST_FILTER_VALUE)
-        & ~checkout_filled
-    ]
+def process_excel_with_report(
+    file_bytes: bytes,
+    compression_level: int | None = None,
+    match_mode: str = MATCH_MODE_EXACT,
+    near_misses: bool = False,
+) -> tuple[BytesIO, MatchReport]:
+    """
+    Igual a `process_excel`, mas também retorna o MatchReport do ESTABELECIMENTO
+    (com `near_misses` preenchido apenas quando pedido).
+    """
+    validate_match_mode(match_mode)
+    excel_file = pd.ExcelFile(BytesIO(file_bytes))
 
-    # === BLOCO 2 (MEIO): TARIFA COM DATA DE CHECKOUT ===
-    cost_tarifa_checkout = detailed[
-        (detailed[COLUMN_ESTABELECIMENTO] == COST_FILTER_VALUE)
-        & checkout_filled
-    ]
+    detailed = pd.read_excel(excel_file, sheet_name=CENTER_SHEET_NAME)
 
-    # === BLOCO 3 (FIM): RESGATE COM DATA DE CHECKOUT ===
-    cost_resgate_checkout = detailed[
-        (detailed[COLUMN_ESTABELECIMENTO] == DISCOUNT_FILTER_VALUE)
-        & checkout_filled
-    ]
+    blocks, match_report = partition_detailed(detailed, match_mode, near_misses)
 
     # Labels divisores
-    title_empresa = pd.DataFrame([{detailed.columns[0]: "Checkouts Empresa"}])
-    title_folha = pd.DataFrame([{detailed.columns[0]: "Checkouts Folha colab"}])
+    title_empresa = pd.DataFrame([{detailed.columns[0]: COST_DIVIDER_EMPRESA}])
+    title_folha = pd.DataFrame([{detailed.columns[0]: COST_DIVIDER_FOLHA}])
 
     title_empresa = title_empresa.reindex(columns=detailed.columns).fillna("")
     title_folha = title_folha.reindex(columns=detailed.columns).fillna("")
 
-    # Montagem final
+    # Montagem final: TARIFA sem checkout (topo), TARIFA com checkout (meio), RESGATE com checkout (fim)
     cost_frame = pd.concat(
         [
-            cost_tarifa_no_checkout, 
+            blocks[BLOCK_TARIFA_SEM_CHECKOUT], 
             title_empresa, 
-            cost_tarifa_checkout, 
+            blocks[BLOCK_TARIFA_CHECKOUT], 
             title_folha, 
-            cost_resgate_checkout
+            blocks[BLOCK_RESGATE_CHECKOUT]
         ],
         ignore_index=True,
     )
 
     # Aba Desconto Folha (Resgates sem checkout)
-    discount_frame = detailed[
-        (detailed[COLUMN_ESTABELECIMENTO] == DISCOUNT_FILTER_VALUE) & ~checkout_filled
-    ]
+    discount_frame = blocks[BLOCK_RESGATE_SEM_CHECKOUT]
 
     workbook = load_workbook(BytesIO(file_bytes))
     overview_sheet = workbook[OVERVIEW_SHEET_NAME]
@@ -309,8 +576,4 @@ def process_excel(file_bytes: bytes) -> BytesIO:
     total_fechamento_value.value = f"={total_empresa_value.coordinate}+{total_func_value.coordinate}"
 
     # Salvar e Retornar
-    output_buffer = BytesIO()
-    workbook.save(output_buffer)
-    output_buffer.seek(0)  # Garantir que o cursor está no início
-    
-    return output_buffer
+    return save_workbook_to_buffer(workbook, compression_level), match_report
@@ -0,0 +1,306 @@
+"""
+Memory Guard
+Estima a memória necessária para processar um .xlsx (antes de abri-lo com
+pandas/openpyxl) e controla a admissão de requisições por um orçamento
+global de memória, evitando que uploads grandes simultâneos derrubem o worker.
+"""
+from __future__ import annotations
+
+import asyncio
+import io
+import os
+import posixpath
+import re
+import zipfile
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import BinaryIO, Union
+from xml.etree import ElementTree
+
+from openpyxl.utils.cell import range_boundaries
+
+
+# =====================
+# Constantes
+# =====================
+# Pico de RSS medido em process_excel (processo novo, planilhas sintéticas de
+# 5k/20k/50k linhas): 13.5-14.9x o XML descompactado das planilhas, ou
+# 630-690 bytes por célula. Os fatores abaixo ficam ~10% acima do pior caso.
+XML_MEMORY_FACTOR = 16.0
+# Custo médio por célula (objeto Cell do openpyxl + DataFrame do pandas)
+CELL_MEMORY_BYTES = 750
+# Custo por célula na leitura em streaming (read_only), que guarda só as linhas filtradas
+STREAMING_CELL_MEMORY_BYTES = 40
+# Overhead fixo por requisição (buffers de upload/saída, estilos, etc.)
+BASE_MEMORY_BYTES = 8 * 1024 * 1024
+# Overhead de cada processo de leitura da consolidação: ~4 MB privados ocioso
+# (forkserver com pandas/openpyxl já importados) mais a folga do alocador
+WORKER_PROCESS_MEMORY_BYTES = 8 * 1024 * 1024
+
+# Quantos bytes do início da planilha ler procurando o <dimension>
+DIMENSION_SCAN_BYTES = 4096
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+_DIMENSION_PATTERN = re.compile(rb'<(?:\w+:)?dimension\s+ref="([^"]+)"')
+
+MB = 1024 * 1024
+
+
+# =====================
+# Exceções
+# =====================
+class MemoryLimitExceeded(Exception):
+    """
+    A requisição sozinha excede o limite por requisição (nunca caberia no orçamento).
+    """
+
+    def __init__(self, estimated_bytes: int, limit_bytes: int):
+        self.estimated_bytes = estimated_bytes
+        self.limit_bytes = limit_bytes
+        super().__init__(
+            f"Memória estimada ({estimated_bytes // MB} MB) excede o limite por requisição "
+            f"({limit_bytes // MB} MB)."
+        )
+
+
+class MemoryBudgetTimeout(Exception):
+    """
+    A requisição ficou na fila além do tempo máximo esperando memória livre.
+    """
+
+    def __init__(self, estimated_bytes: int, timeout: float):
+        self.estimated_bytes = estimated_bytes
+        self.timeout = timeout
+        super().__init__(
+            f"Servidor ocupado: sem memória disponível para {estimated_bytes // MB} MB "
+            f"após {timeout:.0f}s na fila."
+        )
+
+
+# =====================
+# Estimativa
+# =====================
+@dataclass
+class SheetEstimate:
+    name: str
+    xml_bytes: int
+    rows: int | None = None
+    columns: int | None = None
+
+    @property
+    def cells(self) -> int | None:
+        if self.rows is None or self.columns is None:
+            return None
+        return self.rows * self.columns
+
+
+@dataclass
+class MemoryEstimate:
+    compressed_bytes: int
+    xml_bytes: int
+    sheets: list[SheetEstimate] = field(default_factory=list)
+
+    @property
+    def cells(self) -> int:
+        return sum(sheet.cells or 0 for sheet in self.sheets)
+
+    @property
+    def estimated_bytes(self) -> int:
+        by_xml = self.xml_bytes * XML_MEMORY_FACTOR
+        by_cells = self.cells * CELL_MEMORY_BYTES
+        return int(BASE_MEMORY_BYTES + max(by_xml, by_cells))
+
+    @property
+    def streaming_bytes(self) -> int:
+        """
+        Estimativa para leitura em streaming (consolidação), sem carregar o workbook inteiro.
+        """
+        return int(BASE_MEMORY_BYTES + self.cells * STREAMING_CELL_MEMORY_BYTES)
+
+
+def _sheet_paths(archive: zipfile.ZipFile) -> dict[str, str]:
+    """
+    Mapeia nome da aba -> caminho do XML dentro do zip (via workbook.xml + rels).
+    """
+    try:
+        workbook_xml = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        rels_xml = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    except KeyError:
+        return {}
+
+    targets = {}
+    for rel in rels_xml.iter(f"{_NS_PKG_REL}Relationship"):
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            path = target.lstrip("/")
+        else:
+            path = posixpath.normpath(posixpath.join("xl", target))
+        targets[rel.get("Id")] = path
+
+    paths = {}
+    for sheet in workbook_xml.iter(f"{_NS_MAIN}sheet"):
+        path = targets.get(sheet.get(f"{_NS_REL}id"))
+        if path:
+            paths[sheet.get("name")] = path
+    return paths
+
+
+def _read_dimension(archive: zipfile.ZipFile, path: str) -> tuple[int, int] | None:
+    """
+    Lê apenas o início do XML da aba e extrai (linhas, colunas) do <dimension>.
+    """
+    with archive.open(path) as stream:
+        head = stream.read(DIMENSION_SCAN_BYTES)
+    match = _DIMENSION_PATTERN.search(head)
+    if not match:
+        return None
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(match.group(1).decode())
+    except (ValueError, TypeError):
+        return None
+    if None in (min_col, min_row, max_col, max_row):
+        return None
+    return max_row - min_row + 1, max_col - min_col + 1
+
+
+def estimate_workbook_memory(source: Union[bytes, BinaryIO, str, os.PathLike]) -> MemoryEstimate:
+    """
+    Estima a memória para processar o arquivo sem descompactar as planilhas.
+
+    Usa o tamanho descompactado dos XMLs (diretório do zip) e a quantidade
+    de linhas/colunas declarada no <dimension> de cada aba.
+
+    Args:
+        source: Bytes do arquivo Excel (.xlsx), arquivo aberto ou caminho (lido só
+            o diretório do zip e o início das abas; a posição volta ao início)
+
+    Returns:
+        MemoryEstimate com o detalhamento por aba
+
+    Raises:
+        ValueError: Se o arquivo não for um .xlsx (zip) válido
+    """
+    if isinstance(source, (bytes, bytearray)):
+        compressed_bytes = len(source)
+        source = BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        compressed_bytes = os.path.getsize(source)
+    else:
+        compressed_bytes = source.seek(0, io.SEEK_END)
+        source.seek(0)
+
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        raise ValueError("Arquivo .xlsx inválido ou corrompido.")
+
+    with archive:
+        sizes = {info.filename: info.file_size for info in archive.infolist()}
+        estimate = MemoryEstimate(
+            compressed_bytes=compressed_bytes,
+            xml_bytes=sizes.get("xl/sharedStrings.xml", 0),
+        )
+
+        for name, path in _sheet_paths(archive).items():
+            if path not in sizes:
+                continue
+            sheet = SheetEstimate(name=name, xml_bytes=sizes[path])
+            dimension = _read_dimension(archive, path)
+            if dimension:
+                sheet.rows, sheet.columns = dimension
+            estimate.sheets.append(sheet)
+            estimate.xml_bytes += sheet.xml_bytes
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return estimate
+
+
+# =====================
+# Controle de Admissão
+# =====================
+class MemoryGuard:
+    """
+    Orçamento global de memória compartilhado pelas requisições do worker.
+
+    Requisições são admitidas por ordem de chegada: enquanto houver fila,
+    quem chega entra no fim dela, mesmo que caiba no orçamento (senão uma
+    sequência de requisições pequenas deixaria a grande esperando até o 503).
+    A espera vai até `queue_timeout` segundos. Requisições maiores que
+    `max_request_bytes` são recusadas imediatamente.
+    """
+
+    def __init__(self, budget_bytes: int, max_request_bytes: int | None = None, queue_timeout: float = 30.0):
+        self.budget_bytes = budget_bytes
+        self.max_request_bytes = min(max_request_bytes or budget_bytes, budget_bytes)
+        self.queue_timeout = queue_timeout
+        self.reserved_bytes = 0
+        # Fila FIFO de (future, bytes); o future é resolvido quando a reserva é concedida
+        self._waiters: deque[tuple[asyncio.Future, int]] = deque()
+
+    @property
+    def available_bytes(self) -> int:
+        return self.budget_bytes - self.reserved_bytes
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def _wake_waiters(self) -> None:
+        """
+        Concede a reserva aos primeiros da fila enquanto couberem (nunca pula o primeiro).
+        """
+        while self._waiters and self._waiters[0][1] <= self.available_bytes:
+            future, estimated_bytes = self._waiters.popleft()
+            self.reserved_bytes += estimated_bytes
+            future.set_result(None)
+
+    def _abandon(self, entry: tuple[asyncio.Future, int]) -> None:
+        """
+        Tira da fila uma espera encerrada (timeout/cancelamento), devolvendo a
+        reserva se ela já tinha sido concedida.
+        """
+        future, estimated_bytes = entry
+        if future.done():
+            self.reserved_bytes -= estimated_bytes
+        else:
+            self._waiters.remove(entry)
+            future.cancel()
+        self._wake_waiters()
+
+    @asynccontextmanager
+    async def reserve(self, estimated_bytes: int):
+        """
+        Reserva `estimated_bytes` do orçamento durante o bloco `async with`.
+
+        Raises:
+            MemoryLimitExceeded: Se a requisição excede o limite por requisição
+            MemoryBudgetTimeout: Se não houve memória livre dentro do timeout
+        """
+        if estimated_bytes > self.max_request_bytes:
+            raise MemoryLimitExceeded(estimated_bytes, self.max_request_bytes)
+
+        if not self._waiters and estimated_bytes <= self.available_bytes:
+            self.reserved_bytes += estimated_bytes
+        else:
+            entry = (asyncio.get_running_loop().create_future(), estimated_bytes)
+            self._waiters.append(entry)
+            try:
+                # asyncio.wait não cancela o future no timeout (a concessão pode chegar junto)
+                await asyncio.wait((entry[0],), timeout=self.queue_timeout)
+            except BaseException:
+                self._abandon(entry)
+                raise
+            if not entry[0].done():
+                self._abandon(entry)
+                raise MemoryBudgetTimeout(estimated_bytes, self.queue_timeout)
+
+        try:
+            yield
+        finally:
+            self.reserved_bytes -= estimated_bytes
+            self._wake_waiters()
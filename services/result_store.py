@@ -0,0 +1,160 @@
+"""
+Result Store
+Guarda os arquivos processados em disco por um tempo limitado, para que a
+resposta seja enviada a partir de arquivo (sem manter o resultado em memória)
+e possa ser baixada novamente com HEAD/Range (downloads retomáveis).
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+
+
+# =====================
+# Constantes
+# =====================
+DEFAULT_TTL_SECONDS = 3600
+RESULT_SUFFIX = ".xlsx"
+META_SUFFIX = ".json"
+RESULT_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass
+class StoredResult:
+    result_id: str
+    path: Path
+    filename: str
+    size: int
+
+
+class ResultStore:
+    """
+    Diretório de resultados com expiração por tempo (TTL).
+
+    Cada resultado tem um `.xlsx` e um `.json` com metadados (nome do arquivo).
+    A limpeza dos expirados acontece a cada novo resultado salvo.
+    """
+
+    def __init__(self, directory: str | os.PathLike | None = None, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.directory = Path(directory or Path(tempfile.gettempdir()) / "excel_results")
+        self.ttl_seconds = ttl_seconds
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def save(self, output: BytesIO, filename: str) -> StoredResult:
+        """
+        Grava o buffer em disco (via memoryview, sem cópia) e devolve o resultado.
+        """
+        self.cleanup()
+        result_id = uuid.uuid4().hex
+        path = self.directory / f"{result_id}{RESULT_SUFFIX}"
+        tmp_path = path.with_suffix(".tmp")
+
+        with open(tmp_path, "wb") as file, output.getbuffer() as view:
+            file.write(view)
+            size = view.nbytes
+        os.replace(tmp_path, path)
+
+        meta_path = self.directory / f"{result_id}{META_SUFFIX}"
+        meta_path.write_text(json.dumps({"filename": filename}, ensure_ascii=False), encoding="utf-8")
+        return StoredResult(result_id=result_id, path=path, filename=filename, size=size)
+
+    def get(self, result_id: str) -> StoredResult | None:
+        """
+        Busca um resultado ainda válido. IDs fora do formato esperado retornam None.
+        """
+        if not RESULT_ID_PATTERN.match(result_id):
+            return None
+        path = self.directory / f"{result_id}{RESULT_SUFFIX}"
+        try:
+            stat_result = path.stat()
+        except FileNotFoundError:
+            return None
+        if self._expired(stat_result.st_mtime):
+            self._remove(result_id)
+            return None
+
+        try:
+            meta = json.loads((self.directory / f"{result_id}{META_SUFFIX}").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            meta = {}
+        filename = meta.get("filename") or f"{result_id}{RESULT_SUFFIX}"
+        return StoredResult(result_id=result_id, path=path, filename=filename, size=stat_result.st_size)
+
+    def cleanup(self) -> int:
+        """
+        Remove resultados expirados. Retorna quantos foram removidos.
+        """
+        removed = 0
+        for path in self.directory.glob(f"*{RESULT_SUFFIX}"):
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if self._expired(mtime):
+                self._remove(path.stem)
+                removed += 1
+        return removed
+
+    def _expired(self, mtime: float) -> bool:
+        return time.time() - mtime > self.ttl_seconds
+
+    def _remove(self, result_id: str) -> None:
+        for suffix in (RESULT_SUFFIX, META_SUFFIX):
+            try:
+                (self.directory / f"{result_id}{suffix}").unlink()
+            except FileNotFoundError:
+                pass
+
+
+# =====================
+# Range
+# =====================
+def parse_range_header(range_header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Interpreta um header `Range: bytes=...` de intervalo único.
+
+    Args:
+        range_header: Valor do header Range (ou None)
+        size: Tamanho total do arquivo em bytes
+
+    Returns:
+        (início, fim) inclusivos, ou None se não houver Range aplicável
+        (header ausente, outra unidade ou múltiplos intervalos -> resposta completa)
+
+    Raises:
+        ValueError: Se o intervalo for inválido ou não satisfazível (416)
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start_text, dash, end_text = spec.strip().partition("-")
+    if not dash:
+        raise ValueError(f"Range inválido: {range_header}")
+
+    try:
+        if start_text == "":
+            # Sufixo: últimos N bytes
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError(f"Range inválido: {range_header}")
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        raise ValueError(f"Range inválido: {range_header}")
+
+    end = min(end, size - 1)
+    if start < 0 or start >= size or start > end:
+        raise ValueError(f"Range não satisfazível: {range_header}")
+    return start, end
@@ -0,0 +1,111 @@
+"""
+Text Normalization
+Normalização de texto (sem acentos, minúsculo, sem espaços nas pontas) usada
+para comparar labels, headers e valores de colunas. Para valores comparados
+com filtros, `normalize_match_key` também colapsa os espaços internos.
+
+O caminho rápido usa uma tabela de tradução pré-calculada para a faixa
+Latin-1/Latin Extended (português); fora dela cai na decomposição NFD, que
+produz exatamente o mesmo resultado. Valores repetidos vêm de um cache.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+
+# =====================
+# Constantes
+# =====================
+# Latin-1 + Latin Extended-A/B: cobre todos os acentos do português
+FAST_PATH_LIMIT = 0x250
+NORMALIZE_CACHE_SIZE = 65536
+
+
+# =====================
+# Implementação de referência
+# =====================
+def strip_accents(text: str) -> str:
+    """
+    Remove marcas combinantes (acentos) via decomposição NFD.
+    """
+    return "".join(
+        c for c in unicodedata.normalize("NFD", text)
+        if unicodedata.category(c) != "Mn"
+    )
+
+
+def _build_accent_table() -> dict[int, str]:
+    table = {}
+    for code_point in range(FAST_PATH_LIMIT):
+        char = chr(code_point)
+        stripped = strip_accents(char)
+        if stripped != char:
+            table[code_point] = stripped
+    return table
+
+
+ACCENT_TABLE = _build_accent_table()
+_FAST_PATH_MAX_CHAR = chr(FAST_PATH_LIMIT - 1)
+
+
+# =====================
+# Normalização
+# =====================
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def _normalize_str(text: str) -> str:
+    text = text.strip().lower()
+    if text.isascii():
+        return text
+    if max(text) <= _FAST_PATH_MAX_CHAR:
+        return text.translate(ACCENT_TABLE)
+    return strip_accents(text)
+
+
+def normalize_text(value: object) -> str:
+    """
+    Normaliza texto removendo acentos, convertendo para lowercase e removendo espaços.
+    """
+    if value is None:
+        return ""
+    return _normalize_str(value if isinstance(value, str) else str(value))
+
+
+def collapse_spaces(text: str) -> str:
+    """
+    Troca sequências de espaços (inclusive no meio do texto) por um único espaço.
+    """
+    return " ".join(text.split())
+
+
+def normalize_match_key(value: object) -> str:
+    """
+    Chave para comparar valores com filtros: `normalize_text` com os espaços
+    internos colapsados ("RESGATE  LIMITE" == "resgate limite").
+
+    Labels e headers continuam usando `normalize_text`, que só remove os
+    espaços das pontas.
+    """
+    return collapse_spaces(normalize_text(value))
+
+
+def normalize_series(series: pd.Series) -> pd.Series:
+    """
+    Versão vetorizada de `normalize_text` para uma coluna inteira.
+
+    Cada valor distinto é normalizado uma única vez (factorize) e o resultado
+    é espalhado pelos códigos. Valores ausentes (None/NaN/NaT) viram "".
+
+    Colunas que não são só texto são agrupadas pelo `str()` de cada valor:
+    o factorize juntaria valores de hash igual (1, 1.0, True, -0.0/0.0) que
+    `normalize_text` distingue ("1", "1.0", "true").
+    """
+    if pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        series = series.map(str, na_action="ignore")
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    normalized = np.array([normalize_text(value) for value in uniques] + [""], dtype=object)
+    # Sentinela -1 (ausente) aponta para o "" no fim do array
+    return pd.Series(normalized[codes], index=series.index, name=series.name, dtype=object)
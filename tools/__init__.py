@@ -0,0 +1,4 @@
+"""
+Ferramentas de desenvolvimento (carga, planilhas sintéticas).
+Não fazem parte do deploy da API.
+"""
@@ -0,0 +1,226 @@
+"""
+Checagens da API
+Confere `parse_range_header`, a expiração do `ResultStore`, a ordem de
+admissão do `MemoryGuard` e as respostas de `GET|HEAD /results/{id}`
+(200, HEAD, 206, sufixo, 416, 404) com o TestClient do FastAPI, sem subir
+servidor.
+
+Uso:
+    python -m tools.api_check
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+from services.memory_guard import MemoryBudgetTimeout, MemoryGuard
+from services.result_store import ResultStore, parse_range_header
+from tools.synthetic import generate_workbook
+
+
+# =====================
+# Constantes
+# =====================
+# Blocos pequenos para a resposta atravessar vários envios
+CHECK_CHUNK_SIZE = 1024
+CHECK_ROWS = 50
+
+
+class CheckFailed(AssertionError):
+    pass
+
+
+def expect(condition: bool, message: str) -> None:
+    if not condition:
+        raise CheckFailed(message)
+
+
+# =====================
+# Range
+# =====================
+def check_parse_range_header() -> None:
+    size = 100
+    cases = [
+        (None, None),
+        ("", None),
+        ("bytes=0-9", (0, 9)),
+        ("bytes=90-", (90, 99)),
+        ("bytes=95-500", (95, 99)),
+        ("bytes=-10", (90, 99)),
+        ("bytes=-500", (0, 99)),
+        ("items=0-9", None),
+        ("bytes=0-9,20-29", None),
+    ]
+    for header, expected in cases:
+        actual = parse_range_header(header, size)
+        expect(actual == expected, f"parse_range_header({header!r}): esperado {expected}, obtido {actual}")
+
+    for header in ("bytes=100-", "bytes=50-10", "bytes=-0", "bytes=abc", "bytes=5"):
+        try:
+            actual = parse_range_header(header, size)
+        except ValueError:
+            continue
+        raise CheckFailed(f"parse_range_header({header!r}) deveria ser 416, obtido {actual}")
+
+
+# =====================
+# ResultStore
+# =====================
+def check_result_store_expiry() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(directory, ttl_seconds=60)
+        fresh = store.save(BytesIO(b"novo"), "novo.xlsx")
+        stale = store.save(BytesIO(b"antigo"), "antigo.xlsx")
+
+        found = store.get(fresh.result_id)
+        expect(found is not None and found.filename == "novo.xlsx" and found.size == 4, "Resultado válido não encontrado")
+        expect(store.get("../" + fresh.result_id) is None, "ID fora do formato deveria retornar None")
+
+        expired_at = time.time() - 120
+        os.utime(stale.path, (expired_at, expired_at))
+        expect(store.get(stale.result_id) is None, "Resultado expirado ainda foi retornado")
+        expect(not stale.path.exists(), "Resultado expirado não foi removido do disco")
+
+        os.utime(fresh.path, (expired_at, expired_at))
+        expect(store.cleanup() == 1, "cleanup() deveria remover 1 resultado expirado")
+        expect(not any(Path(directory).iterdir()), "cleanup() deixou arquivos para trás")
+
+
+# =====================
+# MemoryGuard
+# =====================
+async def _memory_guard_fifo() -> None:
+    guard = MemoryGuard(budget_bytes=100, queue_timeout=2.0)
+    admitted = []
+
+    async def request(name: str, size: int, hold: float) -> None:
+        async with guard.reserve(size):
+            admitted.append(name)
+            await asyncio.sleep(hold)
+
+    # Fluxo contínuo de pequenas sobrepostas (sempre há 40-80 B ocupados); a grande
+    # chega no meio e não pode ser ultrapassada pelas pequenas que chegam depois dela
+    tasks = []
+    for index in range(12):
+        if index == 2:
+            tasks.append(asyncio.create_task(request("grande", 90, 0.02)))
+        tasks.append(asyncio.create_task(request(f"pequena{index}", 40, 0.06)))
+        await asyncio.sleep(0.03)
+    await asyncio.gather(*tasks)
+    later = [f"pequena{index}" for index in range(2, 12)]
+    position = admitted.index("grande")
+    expect(
+        all(admitted.index(name) > position for name in later),
+        f"Pequenas que chegaram depois entraram antes da grande: {admitted}",
+    )
+    expect(guard.reserved_bytes == 0 and guard.waiting == 0, "Reservas/fila não foram liberadas")
+
+    # Timeout e cancelamento saem da fila e liberam quem está atrás
+    guard = MemoryGuard(budget_bytes=100, queue_timeout=0.05)
+    async with guard.reserve(90):
+        try:
+            async with guard.reserve(50):
+                raise CheckFailed("Reserva acima do disponível foi concedida")
+        except MemoryBudgetTimeout:
+            pass
+        cancelled = asyncio.create_task(request("cancelada", 50, 0))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        expect(guard.waiting == 0, "Espera encerrada ficou na fila")
+    expect(guard.reserved_bytes == 0, "Reserva vazou após timeout/cancelamento")
+
+
+def check_memory_guard_fifo() -> None:
+    asyncio.run(_memory_guard_fifo())
+
+
+# =====================
+# Endpoints
+# =====================
+def check_results_endpoint(client) -> None:
+    upload = generate_workbook(CHECK_ROWS, seed=1)
+    response = client.post(
+        "/process",
+        files={"file": ("checagem.xlsx", upload, "application/octet-stream")},
+    )
+    expect(response.status_code == 200, f"POST /process: {response.status_code} {response.text[:200]}")
+    result_id = response.headers.get("x-result-id")
+    expect(bool(result_id), "POST /process sem X-Result-Id")
+    content = response.content
+    size = len(content)
+    expect(size > 3 * CHECK_CHUNK_SIZE, "Resultado pequeno demais para exercitar o envio em blocos")
+    expect(response.headers.get("accept-ranges") == "bytes", "POST /process sem Accept-Ranges")
+
+    url = f"/results/{result_id}"
+    full = client.get(url)
+    expect(full.status_code == 200 and full.content == content, "GET completo difere do POST /process")
+    expect(full.headers.get("content-length") == str(size), "GET completo com Content-Length errado")
+    expect('filename="processado_checagem.xlsx"' in full.headers.get("content-disposition", ""), "Nome do arquivo perdido")
+
+    head = client.head(url)
+    expect(head.status_code == 200 and head.content == b"", "HEAD deveria responder 200 sem corpo")
+    expect(head.headers.get("content-length") == str(size), "HEAD com Content-Length errado")
+
+    partial = client.get(url, headers={"Range": "bytes=0-99"})
+    expect(partial.status_code == 206, f"Range 0-99: esperado 206, obtido {partial.status_code}")
+    expect(partial.content == content[:100], "Range 0-99 com conteúdo errado")
+    expect(partial.headers.get("content-range") == f"bytes 0-99/{size}", "Range 0-99 com Content-Range errado")
+
+    resumed = client.get(url, headers={"Range": f"bytes={CHECK_CHUNK_SIZE + 7}-"})
+    expect(resumed.status_code == 206 and resumed.content == content[CHECK_CHUNK_SIZE + 7:], "Retomada (início-) com conteúdo errado")
+
+    suffix = client.get(url, headers={"Range": "bytes=-50"})
+    expect(suffix.status_code == 206 and suffix.content == content[-50:], "Range de sufixo com conteúdo errado")
+    expect(suffix.headers.get("content-range") == f"bytes {size - 50}-{size - 1}/{size}", "Sufixo com Content-Range errado")
+
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={size}-"})
+    expect(unsatisfiable.status_code == 416, f"Range fora do arquivo: esperado 416, obtido {unsatisfiable.status_code}")
+    expect(unsatisfiable.headers.get("content-range") == f"bytes */{size}", "416 sem Content-Range bytes */tamanho")
+
+    missing = client.get("/results/" + "0" * 32)
+    expect(missing.status_code == 404, f"Resultado inexistente: esperado 404, obtido {missing.status_code}")
+
+
+# =====================
+# Execução
+# =====================
+def main() -> int:
+    results_dir = tempfile.TemporaryDirectory()
+    # Configuração do app antes do import (lida no carregamento de main.py)
+    os.environ.pop("API_KEY", None)
+    os.environ["RESULTS_DIR"] = results_dir.name
+    os.environ["OUTPUT_CHUNK_SIZE"] = str(CHECK_CHUNK_SIZE)
+
+    from fastapi.testclient import TestClient
+    from main import app
+
+    checks = [
+        ("parse_range_header", check_parse_range_header),
+        ("result_store_expiry", check_result_store_expiry),
+        ("memory_guard_fifo", check_memory_guard_fifo),
+        ("results_endpoint", lambda: check_results_endpoint(TestClient(app))),
+    ]
+
+    failures = 0
+    with results_dir:
+        for name, check in checks:
+            try:
+                check()
+            except CheckFailed as e:
+                failures += 1
+                print(f"[FALHOU] {name}: {e}")
+            else:
+                print(f"[ok] {name}")
+
+    print(f"{len(checks) - failures}/{len(checks)} checagens sem falhas.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Golden Outputs do Processamento
+Corpus de variações sintéticas do template e os snapshots estruturais
+esperados da saída de `process_excel` e de `consolidate_excel`
+(tools/golden_outputs/*.json).
+
+Uso:
+    python -m tools.golden                      # confere a saída atual com os snapshots
+    python -m tools.golden --update             # regrava os snapshots (mudança intencional)
+    python -m tools.golden --candidate modulo:funcao
+        # confere uma implementação alternativa (ex.: fast path) contra a referência
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import sys
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+
+from services.consolidation import consolidate_excel
+from services.excel_processor import (
+    COST_HEADER_DEBITO_ACCENT,
+    MATCH_MODE_NORMALIZED,
+    process_excel,
+)
+from tools.synthetic import generate_workbook
+from tools.workbook_diff import diff_snapshots, snapshot_workbook
+
+
+# =====================
+# Corpus
+# =====================
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden_outputs"
+GOLDEN_ROWS = 24
+
+
+@dataclass
+class GoldenCase:
+    """
+    Uma variação do template: parâmetros da planilha sintética e do processamento.
+    Com `periods` (período -> parâmetros da planilha), o caso roda `consolidate_excel`.
+    """
+    name: str
+    description: str
+    workbook: dict = field(default_factory=dict)
+    process: dict = field(default_factory=dict)
+    periods: dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def is_consolidation(self) -> bool:
+        return bool(self.periods)
+
+    def input_bytes(self, workbook: dict | None = None) -> bytes:
+        options = {"rows": GOLDEN_ROWS, "seed": 1, **(self.workbook if workbook is None else workbook)}
+        return generate_workbook(**options)
+
+    @property
+    def path(self) -> Path:
+        return GOLDEN_DIR / f"{self.name}.json"
+
+
+CASES = [
+    GoldenCase("padrao", "Template completo com os dois filtros e checkouts mistos"),
+    GoldenCase(
+        "sem_creditos",
+        "Overview sem a linha 'Créditos inseridos'",
+        workbook={"include_creditos": False},
+    ),
+    GoldenCase(
+        "debito_acentuado",
+        "Header 'DÉBITO EM FOLHA' com acento",
+        workbook={"debito_header": COST_HEADER_DEBITO_ACCENT, "seed": 2},
+    ),
+    GoldenCase(
+        "abas_antigas",
+        "Entrada já contém 'Custo empresa'/'Desconto folha' (devem ser recriadas no fim)",
+        workbook={"stale_output_sheets": True, "seed": 3},
+    ),
+    GoldenCase(
+        "detalhado_vazio",
+        "Detalhado só com o header",
+        workbook={"rows": 0},
+    ),
+    GoldenCase(
+        "estabelecimento_sujo_exact",
+        "Filtros com espaços/caixa/acentos diferentes, comparação exata",
+        workbook={"dirty_ratio": 0.4, "seed": 4},
+    ),
+    GoldenCase(
+        "estabelecimento_sujo_normalized",
+        "Filtros com espaços/caixa/acentos diferentes, comparação normalizada",
+        workbook={"dirty_ratio": 0.4, "seed": 4},
+        process={"match_mode": MATCH_MODE_NORMALIZED},
+    ),
+    GoldenCase(
+        "sem_compressao",
+        "compression_level=0 não pode alterar o conteúdo",
+        process={"compression_level": 0},
+    ),
+    GoldenCase(
+        "consolidacao_templates_mistos",
+        "Consolidação com header de débito com e sem acento e Overview sem 'Créditos inseridos'",
+        periods={
+            "2024-01": {},
+            "2024-02": {"debito_header": COST_HEADER_DEBITO_ACCENT, "seed": 2},
+            "2024-03": {"include_creditos": False, "stale_output_sheets": True, "seed": 3},
+        },
+    ),
+]
+
+
+# =====================
+# Execução
+# =====================
+def load_candidate(spec: str):
+    """
+    Importa uma função no formato "pacote.modulo:funcao".
+    """
+    module_name, _, function_name = spec.partition(":")
+    if not function_name:
+        raise SystemExit(f"Candidato inválido: {spec} (use modulo:funcao)")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run_case(case: GoldenCase, implementation=process_excel) -> dict:
+    """
+    Processa a entrada do caso e devolve o snapshot estrutural da saída.
+    """
+    if case.is_consolidation:
+        inputs = [(period, case.input_bytes(workbook)) for period, workbook in case.periods.items()]
+        output = consolidate_excel(inputs, **case.process)
+    else:
+        output = implementation(case.input_bytes(), **case.process)
+    if isinstance(output, (bytes, bytearray)):
+        output = BytesIO(output)
+    return snapshot_workbook(output)
+
+
+def write_snapshot(case: GoldenCase, snapshot: dict) -> None:
+    GOLDEN_DIR.mkdir(parents=True, exist_ok=True)
+    payload = {"case": case.name, "description": case.description, **snapshot}
+    case.path.write_text(json.dumps(payload, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def read_snapshot(case: GoldenCase) -> dict | None:
+    if not case.path.exists():
+        return None
+    return json.loads(case.path.read_text(encoding="utf-8"))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Regressão da saída de process_excel/consolidate_excel contra snapshots estruturais")
+    parser.add_argument("--update", action="store_true", help="Regrava os snapshots com a saída atual")
+    parser.add_argument("--case", action="append", help="Executa apenas os casos informados (pode repetir)")
+    parser.add_argument(
+        "--candidate",
+        help="Implementação alternativa (modulo:funcao, mesma assinatura de process_excel) "
+             "comparada com a referência em vez dos snapshots",
+    )
+    args = parser.parse_args(argv)
+
+    cases = [case for case in CASES if not args.case or case.name in args.case]
+    unknown = set(args.case or []) - {case.name for case in cases}
+    if unknown:
+        raise SystemExit(f"Casos desconhecidos: {', '.join(sorted(unknown))}")
+
+    candidate = load_candidate(args.candidate) if args.candidate else None
+    failures = 0
+    for case in cases:
+        if args.update:
+            write_snapshot(case, run_case(case))
+            print(f"[atualizado] {case.name}")
+            continue
+
+        if candidate:
+            if case.is_consolidation:
+                print(f"[ignorado] {case.name} (candidato substitui apenas process_excel)")
+                continue
+            expected = run_case(case)
+            actual = run_case(case, candidate)
+        else:
+            expected = read_snapshot(case)
+            if expected is None:
+                print(f"[sem snapshot] {case.name} (rode com --update)")
+                failures += 1
+                continue
+            actual = run_case(case)
+
+        diffs = diff_snapshots(expected, actual)
+        if diffs:
+            failures += 1
+            print(f"[FALHOU] {case.name}: {case.description}")
+            for line in diffs:
+                print(f"    {line}")
+        else:
+            print(f"[ok] {case.name}")
+
+    if not args.update:
+        print(f"{len(cases) - failures}/{len(cases)} casos sem diferenças.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,466 @@
+"""
+Teste de Carga da API
+Sobe `main:app` localmente com uvicorn, dispara uploads concorrentes de
+planilhas sintéticas em vários tamanhos e gera um relatório JSON com
+latências (p50/p95/p99), throughput, taxa de erro e RSS do servidor.
+
+Uso:
+    python -m tools.load_test --sizes small,medium --concurrency 1,4,8
+    python -m tools.load_test --compare reports/antes.json reports/depois.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from tools.synthetic import SIZE_PRESETS, generate_workbook
+
+
+# =====================
+# Constantes
+# =====================
+REPORT_SCHEMA_VERSION = 1
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Limites padrão para marcar regressão no --compare
+DEFAULT_LATENCY_THRESHOLD = 0.20  # +20% no p95
+DEFAULT_THROUGHPUT_THRESHOLD = 0.20  # -20% no throughput
+DEFAULT_RSS_THRESHOLD = 0.25  # +25% no pico de RSS
+
+
+# =====================
+# Helpers
+# =====================
+def percentile(values: list[float], pct: float) -> float | None:
+    """
+    Percentil por interpolação linear (mesmo critério do numpy padrão).
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def read_rss_mb(pid: int) -> float | None:
+    """
+    Lê o RSS atual do processo em MB (Linux via /proc, demais via psutil se instalado).
+    """
+    status_path = Path(f"/proc/{pid}/status")
+    if status_path.exists():
+        try:
+            for line in status_path.read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    try:
+        import psutil
+    except ImportError:
+        return None
+    try:
+        return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+    except psutil.Error:
+        return None
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def build_multipart(filename: str, payload: bytes) -> tuple[bytes, str]:
+    """
+    Monta o corpo multipart/form-data com o campo `file` esperado por /process.
+    """
+    boundary = uuid.uuid4().hex
+    head = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {XLSX_MEDIA_TYPE}\r\n\r\n"
+    ).encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    return head + payload + tail, f"multipart/form-data; boundary={boundary}"
+
+
+def fetch_server_version(base_url: str, api_key: str | None, timeout: float = 10.0) -> str | None:
+    """
+    Lê a versão da API do servidor sob teste (GET / ou, sem "version", /openapi.json).
+    """
+    headers = {"x-api-key": api_key} if api_key else {}
+    for path, read_version in (
+        ("/", lambda payload: payload.get("version")),
+        ("/openapi.json", lambda payload: payload.get("info", {}).get("version")),
+    ):
+        request = urllib.request.Request(f"{base_url}{path}", headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                version = read_version(json.loads(response.read()))
+        except (urllib.error.URLError, OSError, ValueError, AttributeError):
+            continue
+        if version:
+            return str(version)
+    return None
+
+
+# =====================
+# Servidor e Amostragem
+# =====================
+class RssSampler(threading.Thread):
+    """
+    Amostra o RSS do servidor em intervalos fixos enquanto o teste roda.
+    """
+
+    def __init__(self, pid: int, interval: float, started_at: float):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.started_at = started_at
+        self.samples: list[tuple[float, float]] = []
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            rss = read_rss_mb(self.pid)
+            if rss is not None:
+                self.samples.append((round(time.perf_counter() - self.started_at, 3), round(rss, 1)))
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def window(self, start: float, end: float) -> list[float]:
+        return [rss for t, rss in self.samples if start <= t <= end]
+
+
+def start_server(port: int, api_key: str | None, verbose: bool = False) -> subprocess.Popen:
+    """
+    Sobe `main:app` com uvicorn (1 worker, sem reload) e espera o /health responder.
+    Sem `verbose`, os logs do servidor são descartados para não poluir o relatório.
+    """
+    env = dict(os.environ)
+    if api_key:
+        env["API_KEY"] = api_key
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdout=None if verbose else subprocess.DEVNULL,
+        stderr=None if verbose else subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn encerrou durante a inicialização (código {process.returncode})")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1):
+                return process
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+
+    process.terminate()
+    raise RuntimeError("Timeout aguardando o servidor responder em /health")
+
+
+# =====================
+# Execução
+# =====================
+def send_upload(url: str, body: bytes, content_type: str, api_key: str | None, timeout: float) -> tuple[int, float, int]:
+    """
+    Envia um upload e retorna (status, latência em ms, bytes da resposta).
+    Status 0 indica erro de conexão/timeout.
+    """
+    headers = {"Content-Type": content_type}
+    if api_key:
+        headers["x-api-key"] = api_key
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            size = len(response.read())
+            status = response.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, size = e.code, 0
+    except (urllib.error.URLError, OSError):
+        status, size = 0, 0
+    return status, (time.perf_counter() - started) * 1000, size
+
+
+def run_scenario(
+    base_url: str,
+    size_name: str,
+    rows: int,
+    payload: bytes,
+    concurrency: int,
+    total_requests: int,
+    api_key: str | None,
+    timeout: float,
+    sampler: RssSampler | None,
+    started_at: float,
+) -> dict:
+    """
+    Executa um cenário (tamanho x concorrência) e devolve as métricas agregadas.
+    """
+    body, content_type = build_multipart(f"carga_{size_name}.xlsx", payload)
+    url = f"{base_url}/process"
+
+    window_start = time.perf_counter() - started_at
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(
+            lambda _: send_upload(url, body, content_type, api_key, timeout),
+            range(total_requests),
+        ))
+    wall_seconds = time.perf_counter() - wall_start
+    window_end = time.perf_counter() - started_at
+
+    ok_latencies = [latency for status, latency, _ in results if status == 200]
+    status_counts: dict[str, int] = {}
+    for status, _, _ in results:
+        key = str(status) if status else "connection_error"
+        status_counts[key] = status_counts.get(key, 0) + 1
+
+    errors = total_requests - len(ok_latencies)
+    rss_window = sampler.window(window_start, window_end) if sampler else []
+
+    def rounded(value: float | None) -> float | None:
+        return round(value, 1) if value is not None else None
+
+    return {
+        "size": size_name,
+        "rows": rows,
+        "payload_bytes": len(payload),
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "ok": len(ok_latencies),
+        "errors": errors,
+        "error_rate": round(errors / total_requests, 4) if total_requests else 0.0,
+        "status_counts": status_counts,
+        "latency_ms": {
+            "p50": rounded(percentile(ok_latencies, 50)),
+            "p95": rounded(percentile(ok_latencies, 95)),
+            "p99": rounded(percentile(ok_latencies, 99)),
+            "mean": rounded(sum(ok_latencies) / len(ok_latencies)) if ok_latencies else None,
+            "max": rounded(max(ok_latencies)) if ok_latencies else None,
+        },
+        "throughput_rps": round(len(ok_latencies) / wall_seconds, 3) if wall_seconds else None,
+        "wall_seconds": round(wall_seconds, 3),
+        "rss_mb": {
+            "start": rss_window[0] if rss_window else None,
+            "peak": max(rss_window) if rss_window else None,
+            "end": rss_window[-1] if rss_window else None,
+        },
+    }
+
+
+def run_load_test(args: argparse.Namespace) -> dict:
+    sizes = [name.strip() for name in args.sizes.split(",") if name.strip()]
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    for name in sizes:
+        if name not in SIZE_PRESETS and not name.isdigit():
+            raise SystemExit(f"Tamanho inválido: {name} (use {', '.join(SIZE_PRESETS)} ou um número de linhas)")
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+        server_pid = args.server_pid
+    else:
+        port = args.port or free_port()
+        server = start_server(port, args.api_key, args.verbose)
+        base_url = f"http://127.0.0.1:{port}"
+        server_pid = server.pid
+
+    app_version = fetch_server_version(base_url, args.api_key)
+
+    started_at = time.perf_counter()
+    sampler = None
+    if server_pid:
+        sampler = RssSampler(server_pid, args.sample_interval, started_at)
+        sampler.start()
+
+    scenarios = []
+    try:
+        for name in sizes:
+            rows = SIZE_PRESETS.get(name) or int(name)
+            payload = generate_workbook(rows, seed=args.seed)
+            print(f"[{name}] {rows} linhas, {len(payload) / 1024:.0f} KiB")
+            for level in levels:
+                total = args.requests or max(level * 4, 8)
+                scenario = run_scenario(
+                    base_url, name, rows, payload, level, total,
+                    args.api_key, args.timeout, sampler, started_at,
+                )
+                scenarios.append(scenario)
+                latency = scenario["latency_ms"]
+                print(
+                    f"  c={level:<3} p50={latency['p50']}ms p95={latency['p95']}ms "
+                    f"p99={latency['p99']}ms rps={scenario['throughput_rps']} "
+                    f"erros={scenario['error_rate']:.1%} rss_pico={scenario['rss_mb']['peak']}MB"
+                )
+    finally:
+        if sampler:
+            sampler.stop()
+        if server:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    return {
+        "schema_version": REPORT_SCHEMA_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "app_version": app_version,
+        "git_revision": git_revision(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "sizes": sizes,
+            "concurrency": levels,
+            "requests": args.requests,
+            "seed": args.seed,
+            "timeout": args.timeout,
+            "external_server": bool(args.url),
+        },
+        "scenarios": scenarios,
+        "rss_timeline": sampler.samples if sampler else [],
+    }
+
+
+# =====================
+# Comparação de Relatórios
+# =====================
+def relative_change(before: float | None, after: float | None) -> float | None:
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare_reports(before: dict, after: dict, args: argparse.Namespace) -> int:
+    """
+    Compara dois relatórios cenário a cenário. Retorna 1 se houver regressão.
+    """
+    before_index = {(s["size"], s["concurrency"]): s for s in before["scenarios"]}
+    print(f"Base: {before.get('git_revision')} ({before['created_at']})")
+    print(f"Novo: {after.get('git_revision')} ({after['created_at']})")
+
+    regressions = 0
+    for scenario in after["scenarios"]:
+        key = (scenario["size"], scenario["concurrency"])
+        reference = before_index.get(key)
+        if not reference:
+            print(f"  {key[0]} c={key[1]}: sem cenário equivalente na base")
+            continue
+
+        p95 = relative_change(reference["latency_ms"]["p95"], scenario["latency_ms"]["p95"])
+        rps = relative_change(reference["throughput_rps"], scenario["throughput_rps"])
+        rss = relative_change(reference["rss_mb"]["peak"], scenario["rss_mb"]["peak"])
+
+        flags = []
+        if p95 is not None and p95 > args.latency_threshold:
+            flags.append("p95")
+        if rps is not None and -rps > args.throughput_threshold:
+            flags.append("throughput")
+        if rss is not None and rss > args.rss_threshold:
+            flags.append("rss")
+        if scenario["error_rate"] > reference["error_rate"]:
+            flags.append("erros")
+        regressions += bool(flags)
+
+        def fmt(change: float | None) -> str:
+            return f"{change:+.1%}" if change is not None else "n/d"
+
+        status = f"REGRESSÃO ({', '.join(flags)})" if flags else "ok"
+        print(
+            f"  {key[0]} c={key[1]}: p95 {fmt(p95)}, throughput {fmt(rps)}, "
+            f"rss {fmt(rss)}, erros {reference['error_rate']:.1%} -> {scenario['error_rate']:.1%} [{status}]"
+        )
+
+    return 1 if regressions else 0
+
+
+# =====================
+# CLI
+# =====================
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Teste de carga do endpoint POST /process")
+    parser.add_argument("--sizes", default="small,medium", help="Presets (small,medium,large) ou número de linhas, separados por vírgula")
+    parser.add_argument("--concurrency", default="1,4,8", help="Níveis de concorrência, separados por vírgula")
+    parser.add_argument("--requests", type=int, default=0, help="Requisições por cenário (padrão: 4x a concorrência, mínimo 8)")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY"), help="Valor do header x-api-key (padrão: $API_KEY)")
+    parser.add_argument("--url", help="Usa um servidor já em execução em vez de subir um local")
+    parser.add_argument("--server-pid", type=int, help="PID do servidor externo para amostrar RSS")
+    parser.add_argument("--port", type=int, help="Porta do servidor local (padrão: porta livre)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Timeout por requisição em segundos")
+    parser.add_argument("--sample-interval", type=float, default=0.25, help="Intervalo de amostragem de RSS em segundos")
+    parser.add_argument("--verbose", action="store_true", help="Mostra os logs do servidor local")
+    parser.add_argument("--output", help="Caminho do relatório JSON (padrão: reports/load_<data>_<rev>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NOVO"), help="Compara dois relatórios e sai com código 1 em regressão")
+    parser.add_argument("--latency-threshold", type=float, default=DEFAULT_LATENCY_THRESHOLD)
+    parser.add_argument("--throughput-threshold", type=float, default=DEFAULT_THROUGHPUT_THRESHOLD)
+    parser.add_argument("--rss-threshold", type=float, default=DEFAULT_RSS_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+
+    if args.compare:
+        before, after = (json.loads(Path(path).read_text(encoding="utf-8")) for path in args.compare)
+        return compare_reports(before, after, args)
+
+    report = run_load_test(args)
+
+    output = Path(args.output) if args.output else (
+        PROJECT_ROOT / "reports"
+        / f"load_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{report['git_revision'] or 'local'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Relatório salvo em: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
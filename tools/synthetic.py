@@ -0,0 +1,186 @@
+"""
+Gerador de Planilhas Sintéticas
+Cria arquivos .xlsx com a mesma estrutura do relatório original
+(abas Overview e Detalhado) para testes de carga e regressão.
+"""
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+from services.excel_processor import (
+    CENTER_SHEET_NAME,
+    COST_FILTER_VALUE,
+    COST_HEADER_DEBITO,
+    COST_SHEET_NAME,
+    DISCOUNT_FILTER_VALUE,
+    DISCOUNT_SHEET_NAME,
+    OVERVIEW_A_DEBITAR_LABEL,
+    OVERVIEW_CHECKOUT_PAGAR_LABEL,
+    OVERVIEW_CREDITOS_INSERIDOS_LABEL,
+    OVERVIEW_SHEET_NAME,
+    OVERVIEW_SUBSIDIOS_LABEL,
+    OVERVIEW_TAXA_ADMIN_LABEL,
+    OVERVIEW_TOTAL_FECHAMENTO_LABEL,
+    OVERVIEW_TOTAL_FUNC_LABEL,
+    OVERVIEW_TOTAL_LABEL,
+)
+
+
+# =====================
+# Constantes
+# =====================
+# "DEBITO EM FOLHA" precisa ficar na coluna M (fórmula fixa 'Desconto folha'!M:M)
+DETAILED_HEADERS = [
+    "NOME",
+    "CPF",
+    "MATRICULA",
+    "CENTRO DE CUSTO",
+    "DATA",
+    "ESTABELECIMENTO",
+    "CATEGORIA",
+    "VALOR",
+    "CHECKOUT",
+    "PARCELA",
+    "STATUS",
+    "OBSERVACAO",
+    "DEBITO EM FOLHA",
+]
+
+OTHER_ESTABELECIMENTOS = [
+    "FARMACIA CENTRAL",
+    "POSTO IPIRANGA",
+    "SUPERMERCADO BOM PRECO",
+    "RESTAURANTE SABOR",
+]
+
+# Variações "sujas" dos filtros (espaços, caixa, acentos), como chegam em arquivos reais
+DIRTY_VARIANTS = (
+    lambda value: f" {value} ",
+    lambda value: value.lower(),
+    lambda value: value.title(),
+    lambda value: value.replace("A", "Á", 1),
+)
+
+# Presets de tamanho usados pelo teste de carga (nome -> linhas no Detalhado)
+SIZE_PRESETS = {
+    "small": 200,
+    "medium": 5_000,
+    "large": 50_000,
+}
+
+
+# =====================
+# Geração
+# =====================
+def build_overview(sheet, include_creditos: bool = True) -> None:
+    """
+    Monta a aba Overview com os labels esperados pelo processamento.
+    Sem `include_creditos`, a linha "Créditos inseridos" (removida no processamento) fica em branco.
+    """
+    bold = Font(bold=True)
+    sheet["A1"] = "Resumo do fechamento"
+    sheet["A1"].font = bold
+
+    rows = [
+        (OVERVIEW_CHECKOUT_PAGAR_LABEL, 0),
+        (OVERVIEW_TAXA_ADMIN_LABEL, 0),
+        (OVERVIEW_SUBSIDIOS_LABEL, 0),
+        (OVERVIEW_CREDITOS_INSERIDOS_LABEL, 0) if include_creditos else (None, None),
+        (OVERVIEW_TOTAL_LABEL, 0),
+        (None, None),
+        (OVERVIEW_A_DEBITAR_LABEL, 0),
+        (OVERVIEW_TOTAL_FUNC_LABEL, 0),
+        (None, None),
+    ]
+    for offset, (label, value) in enumerate(rows, start=3):
+        if label is None:
+            continue
+        sheet.cell(row=offset, column=1, value=label)
+        value_cell = sheet.cell(row=offset, column=2, value=value)
+        value_cell.number_format = '"R$" #,##0.00'
+
+    # O valor do TOTAL DO FECHAMENTO fica na linha abaixo do label
+    fechamento_row = 3 + len(rows)
+    sheet.cell(row=fechamento_row, column=1, value=OVERVIEW_TOTAL_FECHAMENTO_LABEL).font = bold
+
+
+def build_detailed(
+    sheet,
+    rows: int,
+    rng: random.Random,
+    dirty_ratio: float = 0.0,
+    debito_header: str = COST_HEADER_DEBITO,
+) -> None:
+    """
+    Preenche a aba Detalhado com linhas aleatórias (mas determinísticas pela seed).
+    Com `dirty_ratio`, essa fração dos ESTABELECIMENTO de filtro recebe uma variação suja.
+    """
+    sheet.append(DETAILED_HEADERS[:-1] + [debito_header])
+    base_date = datetime(2024, 1, 1)
+    estabelecimentos = [COST_FILTER_VALUE, DISCOUNT_FILTER_VALUE] + OTHER_ESTABELECIMENTOS
+
+    for index in range(rows):
+        estabelecimento = rng.choice(estabelecimentos)
+        # Só consome o gerador com dirty_ratio > 0 (mantém as planilhas limpas idênticas)
+        if dirty_ratio and estabelecimento in (COST_FILTER_VALUE, DISCOUNT_FILTER_VALUE) and rng.random() < dirty_ratio:
+            estabelecimento = rng.choice(DIRTY_VARIANTS)(estabelecimento)
+        valor = round(rng.uniform(5, 500), 2)
+        checkout = base_date + timedelta(days=rng.randint(0, 27)) if rng.random() < 0.5 else None
+        sheet.append([
+            f"COLABORADOR {index:06d}",
+            f"{rng.randint(0, 99_999_999_999):011d}",
+            index + 1000,
+            f"CC-{rng.randint(1, 20):02d}",
+            base_date + timedelta(days=rng.randint(0, 27)),
+            estabelecimento,
+            "BENEFICIO",
+            valor,
+            checkout,
+            1,
+            "ATIVO",
+            "",
+            valor,
+        ])
+
+
+def generate_workbook(
+    rows: int,
+    seed: int = 0,
+    dirty_ratio: float = 0.0,
+    include_creditos: bool = True,
+    debito_header: str = COST_HEADER_DEBITO,
+    stale_output_sheets: bool = False,
+) -> bytes:
+    """
+    Gera um .xlsx sintético com o número de linhas pedido no Detalhado.
+
+    Args:
+        rows: Quantidade de linhas de dados na aba Detalhado
+        seed: Semente do gerador aleatório (mesma seed -> mesmo conteúdo)
+        dirty_ratio: Fração (0-1) dos valores de filtro com espaços/caixa/acentos diferentes
+        include_creditos: Inclui a linha "Créditos inseridos" no Overview
+        debito_header: Nome do header da coluna de débito (ex.: com acento)
+        stale_output_sheets: Inclui abas "Custo empresa"/"Desconto folha" antigas (devem ser recriadas)
+
+    Returns:
+        Bytes do arquivo .xlsx
+    """
+    rng = random.Random(seed)
+    workbook = Workbook()
+    overview = workbook.active
+    overview.title = OVERVIEW_SHEET_NAME
+    build_overview(overview, include_creditos)
+    build_detailed(workbook.create_sheet(CENTER_SHEET_NAME), rows, rng, dirty_ratio, debito_header)
+
+    if stale_output_sheets:
+        for name in (COST_SHEET_NAME, DISCOUNT_SHEET_NAME):
+            workbook.create_sheet(name)["A1"] = "conteúdo antigo"
+
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,161 @@
+"""
+Diff Estrutural de Workbooks
+Compara arquivos .xlsx pelo conteúdo (ordem das abas, valores, fórmulas,
+formatos numéricos e style ids), ignorando diferenças de bytes do zip
+(timestamps, ordem interna, nível de compressão).
+
+Uso:
+    python -m tools.workbook_diff esperado.xlsx obtido.xlsx
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from datetime import date, datetime, time, timedelta
+from io import BytesIO
+from pathlib import Path
+
+from openpyxl import load_workbook
+from openpyxl.worksheet.formula import ArrayFormula, DataTableFormula
+
+
+# =====================
+# Constantes
+# =====================
+DEFAULT_NUMBER_FORMAT = "General"
+DEFAULT_STYLE_ID = 0
+MAX_DIFFS_PER_SHEET = 20
+
+
+# =====================
+# Snapshot
+# =====================
+def _serialize_value(value: object) -> object:
+    """
+    Converte o valor da célula para JSON de forma estável entre execuções.
+
+    Raises:
+        TypeError: Para tipos sem serialização definida (um repr genérico
+            traria endereços de memória e o snapshot mudaria a cada execução)
+    """
+    if isinstance(value, (datetime, date, time)):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"timedelta": value.total_seconds()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, ArrayFormula):
+        return {"array": str(value.ref), "f": value.text}
+    if isinstance(value, DataTableFormula):
+        return {"dataTable": {key: item for key, item in value if key != "t"}}
+    raise TypeError(f"Valor de célula sem serialização no snapshot: {type(value).__name__}")
+
+
+def snapshot_workbook(source: bytes | BytesIO | str | Path) -> dict:
+    """
+    Gera uma representação estrutural (serializável em JSON) do workbook.
+
+    Cada célula com valor ou estilo vira um registro com:
+        v: valor (fórmulas mantêm o texto "=...")
+        t: tipo do openpyxl, quando não é texto/número (ex.: "f" para fórmula, "d" para data)
+        nf: formato numérico, quando diferente de "General"
+        s: style id, quando diferente do estilo padrão
+
+    Args:
+        source: Bytes, buffer ou caminho do .xlsx
+
+    Returns:
+        {"sheets": [{"name": ..., "cells": {"A1": {...}}}]} na ordem das abas
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    elif isinstance(source, BytesIO):
+        source.seek(0)
+    workbook = load_workbook(source)
+
+    sheets = []
+    for sheet in workbook.worksheets:
+        cells = {}
+        for row in sheet.iter_rows():
+            for cell in row:
+                if cell.value is None and cell.style_id == DEFAULT_STYLE_ID:
+                    continue
+                record = {"v": _serialize_value(cell.value)}
+                if cell.data_type not in ("s", "n"):
+                    record["t"] = cell.data_type
+                if cell.number_format != DEFAULT_NUMBER_FORMAT:
+                    record["nf"] = cell.number_format
+                if cell.style_id != DEFAULT_STYLE_ID:
+                    record["s"] = cell.style_id
+                cells[cell.coordinate] = record
+        sheets.append({"name": sheet.title, "cells": cells})
+
+    return {"sheets": sheets}
+
+
+# =====================
+# Diff
+# =====================
+def diff_snapshots(expected: dict, actual: dict) -> list[str]:
+    """
+    Lista as diferenças entre dois snapshots (vazia = estruturalmente iguais).
+    """
+    diffs = []
+    expected_names = [sheet["name"] for sheet in expected["sheets"]]
+    actual_names = [sheet["name"] for sheet in actual["sheets"]]
+    if expected_names != actual_names:
+        diffs.append(f"Ordem das abas: esperado {expected_names}, obtido {actual_names}")
+
+    actual_by_name = {sheet["name"]: sheet for sheet in actual["sheets"]}
+    for expected_sheet in expected["sheets"]:
+        name = expected_sheet["name"]
+        actual_sheet = actual_by_name.get(name)
+        if actual_sheet is None:
+            continue
+
+        sheet_diffs = []
+        expected_cells, actual_cells = expected_sheet["cells"], actual_sheet["cells"]
+        for coordinate in sorted(set(expected_cells) | set(actual_cells), key=_coordinate_key):
+            before = expected_cells.get(coordinate)
+            after = actual_cells.get(coordinate)
+            if before != after:
+                sheet_diffs.append(f"'{name}'!{coordinate}: esperado {before}, obtido {after}")
+
+        if len(sheet_diffs) > MAX_DIFFS_PER_SHEET:
+            remaining = len(sheet_diffs) - MAX_DIFFS_PER_SHEET
+            sheet_diffs = sheet_diffs[:MAX_DIFFS_PER_SHEET] + [f"'{name}': ... e mais {remaining} diferenças"]
+        diffs.extend(sheet_diffs)
+
+    return diffs
+
+
+def diff_workbooks(expected: bytes | BytesIO | str | Path, actual: bytes | BytesIO | str | Path) -> list[str]:
+    """
+    Compara dois .xlsx estruturalmente (atalho para snapshot + diff).
+    """
+    return diff_snapshots(snapshot_workbook(expected), snapshot_workbook(actual))
+
+
+def _coordinate_key(coordinate: str) -> tuple[int, int, str]:
+    letters = coordinate.rstrip("0123456789")
+    return int(coordinate[len(letters):]), len(letters), letters
+
+
+# =====================
+# CLI
+# =====================
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Diff estrutural de dois arquivos .xlsx")
+    parser.add_argument("expected", help="Arquivo de referência")
+    parser.add_argument("actual", help="Arquivo a comparar")
+    args = parser.parse_args(argv)
+
+    diffs = diff_workbooks(args.expected, args.actual)
+    for line in diffs:
+        print(line)
+    print("Workbooks equivalentes." if not diffs else f"{len(diffs)} diferença(s).")
+    return 1 if diffs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())